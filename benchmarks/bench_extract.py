@@ -0,0 +1,98 @@
+"""
+Micro-benchmark: single-pass scan_page() vs the decoded-text regex helpers.
+
+    python benchmarks/bench_extract.py [-n ROUNDS] [fixture.html ...]
+
+Uses every page in benchmarks/fixtures/ by default. The bundled fixtures are
+synthetic pages modelled on Steam's browse/favorites markup; drop real saved
+pages (File > Save Page As, "HTML only") into that folder to measure those.
+"""
+import os
+import sys
+import glob
+import time
+import argparse
+import importlib.util
+from collections import Counter
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+
+def load_scraper():
+    sys.path.insert(0, ROOT)
+    spec = importlib.util.spec_from_file_location("scraper", os.path.join(ROOT, "steamworkshop id downloader.py"))
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def chunks_of(body, size):
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+def best_of(fn, rounds):
+    best = float("inf")
+    for _ in range(rounds):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("-n", "--rounds", type=int, default=200)
+    ap.add_argument("pages", nargs="*")
+    args = ap.parse_args()
+
+    sc = load_scraper()
+    pages = args.pages or sorted(glob.glob(os.path.join(HERE, "fixtures", "*.html")))
+    if not pages:
+        print("No fixture pages found.")
+        return 1
+
+    def legacy_page(body):
+        # what fetch_ids did per page: decode, three findall passes, empty-marker search
+        html = body.decode("utf-8", errors="replace")
+        return sc.extract_ids(html), sc.looks_empty(html)
+
+    def legacy_appid(body):
+        # what detect_appid did with page 1: decode again, four more findall passes
+        html = body.decode("utf-8", errors="replace")
+        cands = []
+        cands += sc.RX_APPID_QS.findall(html)
+        cands += sc.RX_APPID_ATTR.findall(html)
+        cands += sc.RX_APPID_ATTR_ESC.findall(html)
+        cands += [m[1] for m in sc.RX_APPID_SCRIPT.findall(html)]
+        return Counter(cands).most_common(1)[0][0] if cands else None
+
+    print(f"{'page':<28}{'KB':>7}{'legacy ms':>11}{'scan ms':>10}{'grid-stop ms':>14}{'speedup':>9}")
+    total_old = total_new = 0.0
+    for path in pages:
+        with open(path, "rb") as f:
+            body = f.read()
+        chunks = chunks_of(body, sc.SCAN_CHUNK)
+
+        old_ids, old_empty = legacy_page(body)
+        old_app = legacy_appid(body)
+        full = sc.scan_page(chunks)
+        stopped = sc.scan_page(chunks, stop_at_grid_end=True)
+        new_app = Counter(full["appids"]).most_common(1)[0][0] if full["appids"] else None
+        assert full["ids"] == old_ids, f"{path}: id mismatch ({len(full['ids'])} vs {len(old_ids)})"
+        assert stopped["ids"] == old_ids, f"{path}: grid-stop id mismatch"
+        assert full["empty"] == old_empty and new_app == old_app, f"{path}: appid/empty mismatch"
+
+        t_old = best_of(lambda: (legacy_page(body), legacy_appid(body)), args.rounds)
+        t_new = best_of(lambda: sc.scan_page(chunks), args.rounds)
+        t_stop = best_of(lambda: sc.scan_page(chunks, stop_at_grid_end=True), args.rounds)
+        total_old += t_old
+        total_new += t_stop
+        print(f"{os.path.basename(path)[:27]:<28}{len(body) / 1024:>7.0f}{t_old * 1e3:>11.3f}"
+              f"{t_new * 1e3:>10.3f}{t_stop * 1e3:>14.3f}{t_old / t_stop:>8.1f}x")
+    print(f"{'total':<35}{total_old * 1e3:>11.3f}{'':>10}{total_new * 1e3:>14.3f}{total_old / total_new:>8.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
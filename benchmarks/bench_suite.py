@@ -0,0 +1,248 @@
+"""
+End-to-end timings against a local Steam stand-in and a stub SteamCMD — no Steam needed.
+
+    python benchmarks/bench_suite.py [--scales 1000,10000,100000] [-n ROUNDS] [--latency MS]
+                                     [--throttle-every K] [--compare OLD.json] [--keep DIR]
+
+For every scale (item count) steam_standin.py serves the listing and the detail API and
+fake_steamcmd.py installs the items into a scratch folder, then the suite times:
+  fetch_ids()                  crawling the listing, serial and with the scraper's concurrency
+  fetch_details() & wrappers   the raw detail API, and the cached wrappers cold and warm
+  ACF parsing                  read_acf() and installed_items() cold/warm
+  content checks               folder_has_content() per item vs disk_index() cold/warm
+  planning                     read ids.txt → plan_downloads() → download_plan.json, as __main__ does
+
+The 127.0.0.1 rate limiter is lifted, so the numbers are the tools' own cost; add
+--latency/--throttle-every to see how they cope with a slow or throttling server.
+Best-of-ROUNDS seconds are saved to benchmarks/results/<date>.json (with Python, OS and
+git commit); --compare prints the ratio against an earlier results file.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import platform
+import functools
+import contextlib
+import subprocess
+import importlib.util
+from datetime import datetime
+
+from bench_extract import ROOT, HERE, load_scraper
+from steam_standin import StandIn, APPID, item_id
+
+RESULTS_DIR = os.path.join(HERE, "results")
+UNTHROTTLED = 1e6  # req/s; lifts the stand-in host's limiter
+SKIP_EVERY = 20    # every Nth listed item is left uninstalled ("new" in the plan)
+EMPTY_EVERY = 50   # every Nth installed item is an empty folder ("empty" in the plan)
+
+
+def load_downloader():
+    sys.path.insert(0, ROOT)
+    spec = importlib.util.spec_from_file_location("downloader", os.path.join(ROOT, "steamcmd automation.py"))
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+@contextlib.contextmanager
+def quiet():
+    with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def timed(fn, rounds, setup=None):
+    """(best seconds over `rounds`, last result); `setup` runs untimed before each round."""
+    best, result = float("inf"), None
+    for _ in range(max(1, rounds)):
+        if setup:
+            setup()
+        with quiet():
+            t = time.perf_counter()
+            result = fn()
+            best = min(best, time.perf_counter() - t)
+    return best, result
+
+
+def remove(path):
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(path)
+
+
+def stub_steamcmd(folder: str) -> str:
+    """A steamcmd launcher in `folder` that runs fake_steamcmd.py with that folder as its home."""
+    stub = os.path.join(HERE, "fake_steamcmd.py")
+    opts = ["--root", folder, "--empty-every", str(EMPTY_EVERY)]
+    os.makedirs(folder, exist_ok=True)
+    if os.name == "nt":
+        path = os.path.join(folder, "steamcmd.cmd")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("@" + subprocess.list2cmdline([sys.executable, stub] + opts) + " %*\n")
+    else:
+        path = os.path.join(folder, "steamcmd")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("#!/bin/sh\nexec " + " ".join(f"'{a}'" for a in [sys.executable, stub] + opts) + ' "$@"\n')
+        os.chmod(path, 0o755)
+    return path
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def bench_scale(n, args, sc, dl, wm, scratch, record):
+    """Run every benchmark at `n` items, calling record(name, seconds)."""
+    standin = StandIn(n, args.latency / 1000, args.throttle_every).start()
+    wm.DETAILS_URL = standin.details_url
+    db = os.path.join(scratch, "workshop_meta.sqlite3")
+    dl.get_details = sc.get_details = functools.partial(wm.get_details, path=db)
+    listed = [item_id(i) for i in range(n)]
+    try:
+        # Listing crawl
+        concurrency = max(1, int(sc.CONFIG.get("concurrency", 1) or 1))
+        for label, workers in (("serial", 1), (f"concurrency {concurrency}", concurrency)):
+            t, ids = timed(lambda: sc.fetch_ids(sc.make_session(workers), standin.listing_url, 0, workers), args.rounds)
+            assert len(ids) == n, f"fetch_ids found {len(ids)} of {n} items"
+            record(f"fetch_ids ({label})", t)
+
+        # Detail API
+        t, (rows, failed) = timed(lambda: wm.fetch_details(listed), args.rounds)
+        assert len(rows) == n and not failed, f"fetch_details: {len(rows)} rows, {len(failed)} failed"
+        record("fetch_details (API only)", t)
+        t, _ = timed(lambda: dl.fetch_remote_timeupdated(listed), args.rounds, lambda: remove(db))
+        record("fetch_remote_timeupdated (cold cache)", t)
+        t, _ = timed(lambda: dl.fetch_remote_timeupdated(listed), args.rounds)
+        record("fetch_remote_timeupdated (warm cache)", t)
+        t, titles = timed(lambda: sc.fetch_titles_via_api(listed), args.rounds)
+        assert len(titles) == n
+        record("fetch_titles_via_api (warm cache)", t)
+
+        # Install with the stub SteamCMD (untimed setup)
+        home = os.path.join(scratch, f"steamcmd_{n}")
+        shutil.rmtree(home, ignore_errors=True)
+        dl.steamcmd_exe = stub_steamcmd(home)
+        dl.WORKSHOP_DIR = os.path.join(home, "steamapps", "workshop")
+        dl.RUN_DIR = os.path.join(home, "run")
+        dl.MANIFEST_DIR = os.path.join(dl.RUN_DIR, "manifests")
+        os.makedirs(dl.RUN_DIR, exist_ok=True)
+        installed = [mid for i, mid in enumerate(listed) if i % SKIP_EVERY != SKIP_EVERY - 1]
+        script = dl.write_runscript(os.path.join(dl.RUN_DIR, "bench.txt"), APPID, installed)
+        subprocess.run(dl.steamcmd_command("bench", "", script), stdout=subprocess.DEVNULL, check=True)
+        acf = dl.acf_path_for_app(APPID)
+
+        # ACF parsing
+        t, data = timed(lambda: dl.read_acf(acf), args.rounds)
+        assert len(data["AppWorkshop"]["WorkshopItemsInstalled"]) == len(installed)
+        record("read_acf", t)
+        t, _ = timed(lambda: dl.installed_items(APPID), args.rounds, dl._acf_cache.clear)
+        record("installed_items (cold)", t)
+        t, _ = timed(lambda: dl.installed_items(APPID), args.rounds)
+        record("installed_items (warm)", t)
+
+        # Content checks
+        t, ok = timed(lambda: sum(dl.folder_has_content(dl.mod_folder_path(APPID, mid)) for mid in installed),
+                      args.rounds)
+        record("folder_has_content (every item)", t)
+        t, index = timed(lambda: dl.disk_index(APPID), args.rounds, lambda: remove(dl.disk_index_path(APPID)))
+        assert sum(dl.has_content(index, mid) for mid in installed) == ok
+        record("disk_index (cold)", t)
+        t, _ = timed(lambda: dl.disk_index(APPID), args.rounds)
+        record("disk_index (warm)", t)
+
+        # Planning, as __main__ does it after asking for the ids file
+        ids_file = os.path.join(scratch, "ids.txt")
+        with open(ids_file, "w", encoding="utf-8") as f:
+            f.write("\n".join(listed))
+        plan_json = os.path.join(scratch, "download_plan.json")
+
+        def plan():
+            p = dl.plan_downloads(APPID, dl.read_ids(ids_file))
+            dl.write_plan(plan_json, APPID, p)
+            return p
+
+        def cold():
+            dl._acf_cache.clear()
+            remove(dl.disk_index_path(APPID))
+            remove(db)
+
+        t, p = timed(plan, args.rounds, cold)
+        record("plan (cold: ACF, disk index, details)", t)
+        t, p = timed(plan, args.rounds)
+        record("plan (warm)", t)
+        print(f"   plan: {p['counts']}  ·  ACF {os.path.getsize(acf) / 1e6:.1f} MB  ·  stand-in served {standin.stats}")
+    finally:
+        standin.stop()
+        if not args.keep:
+            shutil.rmtree(os.path.join(scratch, f"steamcmd_{n}"), ignore_errors=True)
+
+
+def compare(old_path, results):
+    with open(old_path, "r", encoding="utf-8") as f:
+        old = json.load(f)
+    print(f"\nvs {os.path.basename(old_path)} ({old['meta'].get('commit') or '?'}, {old['meta']['date']}):")
+    print(f"{'benchmark':<42}{'items':>8}{'before ms':>12}{'after ms':>11}{'speedup':>9}")
+    for name, by_scale in results.items():
+        for n, t in by_scale.items():
+            before = old["results"].get(name, {}).get(n)
+            if before is None:
+                continue
+            print(f"{name:<42}{n:>8}{before * 1e3:>12.1f}{t * 1e3:>11.1f}{before / t if t else 0:>8.2f}x")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--scales", default="1000,10000,100000", help="comma-separated item counts")
+    ap.add_argument("-n", "--rounds", type=int, default=3)
+    ap.add_argument("--latency", type=float, default=0.0, help="milliseconds the stand-in adds per response")
+    ap.add_argument("--throttle-every", type=int, default=0, help="stand-in answers every Nth request with 429")
+    ap.add_argument("--compare", metavar="OLD.json", help="earlier results file to compare against")
+    ap.add_argument("--keep", metavar="DIR", help="scratch folder to use and keep (default: a temp dir, removed)")
+    ap.add_argument("-o", "--out", help="results file (default: benchmarks/results/<date>.json)")
+    args = ap.parse_args()
+    scales = [int(s) for s in args.scales.split(",") if s.strip()]
+
+    sc = load_scraper()
+    dl = load_downloader()
+    import workshop_meta as wm
+    import steam_http
+    limiter = steam_http.limiter_for("127.0.0.1")
+    limiter.max_rate = limiter.rate = UNTHROTTLED
+
+    scratch = os.path.abspath(args.keep) if args.keep else tempfile.mkdtemp(prefix="swa_bench_")
+    os.makedirs(scratch, exist_ok=True)
+    results = {}
+    try:
+        for n in scales:
+            print(f"\n== {n:,} items ==")
+
+            def record(name, t, n=n):
+                results.setdefault(name, {})[str(n)] = round(t, 6)
+                print(f"   {name:<42}{t * 1e3:>11.1f} ms")
+
+            bench_scale(n, args, sc, dl, wm, scratch, record)
+    finally:
+        if not args.keep:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    meta = {"date": datetime.now().isoformat(timespec="seconds"), "commit": git_commit(),
+            "python": platform.python_version(), "platform": platform.platform(),
+            "rounds": args.rounds, "latency_ms": args.latency, "throttle_every": args.throttle_every}
+    out = args.out or os.path.join(RESULTS_DIR, datetime.now().strftime("%Y-%m-%d %H-%M-%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=1)
+    print(f"\nResults: {out}")
+    if args.compare:
+        compare(args.compare, results)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,155 @@
+"""
+Stub SteamCMD for offline benchmarks: answers +login and workshop_download_item like the
+real client, writing content folders and appworkshop_<appid>.acf without any network.
+
+    python benchmarks/fake_steamcmd.py [--root DIR] [--fail-every N] [--empty-every N] \\
+        [+force_install_dir DIR] +login USER [PASS] (+runscript FILE | +workshop_download_item A ID ... | stdin)
+
+--root stands in for the folder steamcmd.exe lives in (the default install dir).
+Commands come from +runscript, from +command arguments, or from stdin when neither
+ends in quit, the way the downloader's persistent session drives it. Every Nth item
+fails (--fail-every) or is left as an empty folder (--empty-every).
+Item sizes and time_updated match steam_standin.py, so its detail API agrees with
+what is "installed" here except for the items it reports as updated.
+"""
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from steam_standin import UPDATED, item_size
+
+RX_INSTALLED = re.compile(r'"(\d+)"\s*\{\s*"size"\s*"(\d+)"\s*"timeupdated"\s*"(\d+)"\s*"manifest"\s*"(\d+)"')
+FILES = (("About/About.xml", 1), ("About/Preview.png", 4), ("Assemblies/{id}.dll", 10))  # (path, share of the size)
+
+
+def manifest_for(mid: str) -> str:
+    return str(1_000_000_000_000_000_000 + (int(mid) * 2_654_435_761) % 8_000_000_000_000_000_000)
+
+
+def write_item(folder: str, mid: str) -> int:
+    """Lay out one mod the way Workshop content usually looks; returns the bytes written."""
+    total = item_size(mid)
+    weight = sum(w for _, w in FILES)
+    written = 0
+    for n, (rel, w) in enumerate(FILES):
+        size = total - written if n == len(FILES) - 1 else total * w // weight
+        path = os.path.join(folder, rel.format(id=mid))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write((mid.encode() + b"\0") * (size // (len(mid) + 1)) + b"\0" * (size % (len(mid) + 1)))
+        written += size
+    return written
+
+
+def load_acf(path: str) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return {m[0]: (int(m[1]), int(m[2]), m[3]) for m in RX_INSTALLED.findall(f.read())}
+    except OSError:
+        return {}
+
+
+def save_acf(path: str, appid: str, items: dict, touched: int):
+    out = ['"AppWorkshop"\n{\n', f'\t"appid"\t\t"{appid}"\n',
+           f'\t"SizeOnDisk"\t\t"{sum(v[0] for v in items.values())}"\n',
+           '\t"NeedsUpdate"\t\t"0"\n\t"NeedsDownload"\t\t"0"\n',
+           f'\t"TimeLastUpdated"\t\t"{touched}"\n\t"TimeLastAppRan"\t\t"0"\n\t"LastBuildID"\t\t"0"\n',
+           '\t"WorkshopItemsInstalled"\n\t{\n']
+    for mid, (size, updated, manifest) in items.items():
+        out.append(f'\t\t"{mid}"\n\t\t{{\n\t\t\t"size"\t\t"{size}"\n\t\t\t"timeupdated"\t\t"{updated}"\n'
+                   f'\t\t\t"manifest"\t\t"{manifest}"\n\t\t}}\n')
+    out.append('\t}\n\t"WorkshopItemDetails"\n\t{\n')
+    for mid, (size, updated, manifest) in items.items():
+        out.append(f'\t\t"{mid}"\n\t\t{{\n\t\t\t"manifest"\t\t"{manifest}"\n\t\t\t"timeupdated"\t\t"{updated}"\n'
+                   f'\t\t\t"timetouched"\t\t"{touched}"\n\t\t\t"latest_timeupdated"\t\t"{updated}"\n'
+                   f'\t\t\t"latest_manifest"\t\t"{manifest}"\n\t\t}}\n')
+    out.append('\t}\n}\n')
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write("".join(out))
+    os.replace(tmp, path)
+
+
+def main():
+    argv = sys.argv[1:]
+    root = os.path.dirname(os.path.abspath(__file__))
+    fail_every = empty_every = 0
+    while argv and argv[0].startswith("--"):
+        opt, val, argv = argv[0], argv[1], argv[2:]
+        if opt == "--root":
+            root = val
+        elif opt == "--fail-every":
+            fail_every = int(val)
+        elif opt == "--empty-every":
+            empty_every = int(val)
+
+    # "+cmd arg arg +cmd ..." -> command lines, in order
+    commands = []
+    for a in argv:
+        if a.startswith("+"):
+            commands.append([a[1:]])
+        elif commands:
+            commands[-1].append(a)
+    install = root
+    script = []
+    for cmd in commands:
+        if cmd[0] == "force_install_dir" and len(cmd) > 1:
+            install = cmd[1]
+        elif cmd[0] == "runscript" and len(cmd) > 1:
+            with open(cmd[1], "r", encoding="utf-8") as f:
+                script += [line.split() for line in f if line.strip()]
+        elif cmd[0] != "login":
+            script.append(cmd)
+
+    print("Redirecting stderr to 'logs/stderr.txt'")
+    print("Loading Steam API...OK")
+    if any(cmd[0] == "login" for cmd in commands):
+        user = next(cmd for cmd in commands if cmd[0] == "login")[1:2] or ["anonymous"]
+        print(f"Logging in user '{user[0]}' to Steam Public...OK")
+        print("Waiting for user info...OK")
+    sys.stdout.flush()
+
+    ws = os.path.join(install, "steamapps", "workshop")
+    acfs = {}  # appid -> items, written when the batch (or, interactively, each item) ends
+    seq = 0
+    interactive = not script or script[-1][:1] != ["quit"]
+
+    def lines():
+        yield from script
+        if interactive:
+            for line in sys.stdin:
+                yield line.split()
+
+    for cmd in lines():
+        if not cmd:
+            continue
+        if cmd[0] == "quit":
+            break
+        if cmd[0] != "workshop_download_item" or len(cmd) < 3:
+            print(f'Command not found: {cmd[0]}', flush=True)
+            continue
+        appid, mid = cmd[1], cmd[2]
+        seq += 1
+        print(f"Downloading item {mid} ...")
+        if fail_every and seq % fail_every == 0:
+            print(f"ERROR! Download item {mid} failed (Timeout).", flush=True)
+            continue
+        folder = os.path.join(ws, "content", appid, mid)
+        os.makedirs(folder, exist_ok=True)
+        size = 0 if empty_every and seq % empty_every == 0 else write_item(folder, mid)
+        if appid not in acfs:
+            os.makedirs(ws, exist_ok=True)
+            acfs[appid] = load_acf(os.path.join(ws, f"appworkshop_{appid}.acf"))
+        acfs[appid][mid] = (size or item_size(mid), UPDATED, manifest_for(mid))
+        if interactive:
+            save_acf(os.path.join(ws, f"appworkshop_{appid}.acf"), appid, acfs[appid], UPDATED + 3600)
+        print(f'Success. Downloaded item {mid} to "{folder}" ({size} bytes)', flush=interactive)
+    for appid, items in acfs.items():
+        save_acf(os.path.join(ws, f"appworkshop_{appid}.acf"), appid, items, UPDATED + 3600)
+    sys.stdout.flush()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
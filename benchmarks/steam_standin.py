@@ -0,0 +1,203 @@
+"""
+Local stand-in for the parts of Steam the tools talk to, for offline benchmarks.
+
+    python benchmarks/steam_standin.py [--items N] [--latency MS] [--throttle-every K] [--port P]
+
+Serves:
+  GET  /workshop/browse/?appid=A&p=N   synthetic listing pages (30 items each, the
+                                       real markup's pager, grid and empty-page text)
+  POST /ISteamRemoteStorage/GetPublishedFileDetails/v1/
+                                       the detail API for every listed item
+
+Item i has ID FIRST_ID + i. Every K-th request (--throttle-every) is answered with
+429 + Retry-After instead, and every response can be delayed by --latency ms.
+"""
+import json
+import time
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+APPID = "294100"
+FIRST_ID = 3_000_000_000
+PER_PAGE = 30
+UPDATED = 1_700_000_000   # time_updated of every item as installed by fake_steamcmd.py
+OUTDATED_EVERY = 10       # every Nth item has a newer time_updated on the API
+
+
+def item_id(i: int) -> str:
+    return str(FIRST_ID + i)
+
+
+def item_index(mid: str) -> int:
+    return int(mid) - FIRST_ID
+
+
+def item_size(mid: str) -> int:
+    """Bytes of one item's content (see fake_steamcmd.py), 2–18 KB."""
+    return 2048 + (int(mid) * 7919) % 16384
+
+
+def time_updated(mid: str) -> int:
+    return UPDATED + 86400 if item_index(mid) % OUTDATED_EVERY == OUTDATED_EVERY - 1 else UPDATED
+
+
+PAGE_HEAD = """<!DOCTYPE html>
+<html><head><title>Steam Workshop::Stand-in</title>
+<script>PublishedFileService.m_appid = "{appid}";</script>
+</head><body><div class="workshopBrowseItems">
+<div class="workshopBrowsePagingWithBG"><div class="workshopBrowsePagingInfo">Showing {first}-{last} of {total:,} entries</div></div>
+"""
+PAGE_ITEM = ('<div class="workshopItem"><a href="https://steamcommunity.com/sharedfiles/filedetails/?id={id}&searchtext=" '
+             'class="ugc" data-appid="{appid}" data-publishedfileid="{id}"><div class="workshopItemPreviewHolder">'
+             '<img class="workshopItemPreviewImage" src="https://steamuserimages-a.akamaihd.net/ugc/{id}/preview.jpg"></div></a>'
+             '<a href="https://steamcommunity.com/sharedfiles/filedetails/?id={id}&searchtext=" class="item_link">'
+             '<div class="workshopItemTitle ellipsis">Stand-in item {id}</div></a>'
+             '<div class="workshopItemAuthorName">by&nbsp;<a href="https://steamcommunity.com/id/author{n}/myworkshopfiles/?appid={appid}">author{n}</a></div>'
+             '<script>SharedFileBindMouseHover( "sharedfile_{id}", false, {{"id":"{id}","title":"Stand-in item {id}",'
+             '"description":"A description of the item with several sentences of text that the hover card shows.",'
+             '"user_subscribed":false,"user_favorited":false,"played":false,"appid":{appid}}} );</script></div>\n')
+PAGE_TAIL = """</div>
+<div class="workshopBrowsePagingWithBG"><div class="workshopBrowsePagingInfo">Showing {first}-{last} of {total:,} entries</div>
+<div class="workshopBrowsePagingControls"><a class="pagebtn" href="?appid={appid}&p={next}">&gt;</a></div></div>
+<div class="footer">{filler}</div></body></html>
+"""
+EMPTY_PAGE = """<!DOCTYPE html>
+<html><head><title>Steam Workshop::Stand-in</title></head><body>
+<div class="workshopBrowseItems"><div id="no_items">There are no items matching your search criteria.</div></div>
+</body></html>
+"""
+FILLER = "<!-- footer, related apps and scripts -->" * 400  # real pages carry ~20 KB after the grid
+
+
+class StandIn:
+    """A threaded HTTP server on 127.0.0.1 plus its request counters."""
+
+    def __init__(self, items: int, latency: float = 0.0, throttle_every: int = 0, port: int = 0):
+        self.items = items
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.stats = {"pages": 0, "details": 0, "throttled": 0}
+        self.lock = threading.Lock()
+        self.count = 0
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True  # headers and body go out in separate writes
+
+            def log_message(self, *args):
+                pass
+
+            def reply(self, code, body, ctype, headers=()):
+                self.send_response(code)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                for k, v in headers:
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def gate(self):
+                """Latency and 429 injection. Returns True if the request was throttled."""
+                if standin.latency:
+                    time.sleep(standin.latency)
+                with standin.lock:
+                    standin.count += 1
+                    hit = standin.throttle_every and standin.count % standin.throttle_every == 0
+                    if hit:
+                        standin.stats["throttled"] += 1
+                if hit:
+                    self.reply(429, b"Too Many Requests", "text/plain", [("Retry-After", "0")])
+                return hit
+
+            def do_GET(self):
+                if self.gate():
+                    return
+                q = parse_qs(urlparse(self.path).query)
+                page = int((q.get("p") or ["1"])[0])
+                with standin.lock:
+                    standin.stats["pages"] += 1
+                self.reply(200, standin.page(page, (q.get("appid") or [APPID])[0]), "text/html; charset=utf-8")
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0) or 0)).decode()
+                if self.gate():
+                    return
+                form = parse_qs(body)
+                ids = [v[0] for k, v in form.items() if k.startswith("publishedfileids[")]
+                with standin.lock:
+                    standin.stats["details"] += 1
+                self.reply(200, standin.details(ids), "application/json")
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    @property
+    def listing_url(self) -> str:
+        return f"{self.base}/workshop/browse/?appid={APPID}&browsesort=mostrecent&section=readytouseitems"
+
+    @property
+    def details_url(self) -> str:
+        return f"{self.base}/ISteamRemoteStorage/GetPublishedFileDetails/v1/"
+
+    def page(self, page: int, appid: str) -> bytes:
+        start = (page - 1) * PER_PAGE
+        if page < 1 or start >= self.items:
+            return EMPTY_PAGE.encode()
+        stop = min(self.items, start + PER_PAGE)
+        fmt = {"appid": appid, "first": start + 1, "last": stop, "total": self.items, "next": page + 1}
+        parts = [PAGE_HEAD.format(**fmt)]
+        parts += [PAGE_ITEM.format(id=item_id(i), n=i % 997, appid=appid) for i in range(start, stop)]
+        parts.append(PAGE_TAIL.format(filler=FILLER, **fmt))
+        return "".join(parts).encode()
+
+    def details(self, ids: list[str]) -> bytes:
+        rows = []
+        for mid in ids:
+            if mid.isdigit() and 0 <= item_index(mid) < self.items:
+                rows.append({"publishedfileid": mid, "result": 1, "consumer_app_id": int(APPID),
+                             "title": f"Stand-in item {mid}", "time_updated": time_updated(mid),
+                             "file_size": item_size(mid)})
+            else:
+                rows.append({"publishedfileid": mid, "result": 9})
+        return json.dumps({"response": {"result": 1, "resultcount": len(rows),
+                                        "publishedfiledetails": rows}}).encode()
+
+    def start(self) -> "StandIn":
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Serve synthetic Workshop listings and a detail API on 127.0.0.1.")
+    ap.add_argument("--items", type=int, default=1000)
+    ap.add_argument("--latency", type=float, default=0.0, help="milliseconds added to every response")
+    ap.add_argument("--throttle-every", type=int, default=0, help="answer every Nth request with 429")
+    ap.add_argument("--port", type=int, default=8790)
+    args = ap.parse_args()
+    s = StandIn(args.items, args.latency / 1000, args.throttle_every, args.port)
+    print(f"Listing:     {s.listing_url}")
+    print(f"Details API: {s.details_url}")
+    try:
+        s.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        s.server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
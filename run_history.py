@@ -0,0 +1,237 @@
+"""
+Compact run history for "steamworkshop id downloader.py".
+
+Every scrape appends one record to lists/history.jsonl.gz: the IDs added and removed
+since the previous run and the titles that are new or changed. Each record is its own
+gzip member, so appending never rewrites the file, and any past run's lists can be
+rebuilt by replaying the log from the start. A record torn by a crash mid-append ends
+the readable log; the next append moves the damaged bytes aside to
+"history.jsonl.gz.damaged-<time>" and continues from the last intact record.
+
+    python run_history.py list   "<game folder>/lists"
+    python run_history.py export "<game folder>/lists" RUN [-o FOLDER]
+    python run_history.py diff   "<game folder>/lists" RUN_A RUN_B
+
+RUN is a run number from `list`; negative numbers count from the end (-1 = latest).
+"""
+import os
+import gzip
+import json
+import zlib
+import argparse
+from datetime import datetime
+
+HISTORY_NAME = "history.jsonl.gz"
+READ_CHUNK = 64 * 1024
+ITEM_URL = "https://steamcommunity.com/sharedfiles/filedetails/?id={}"
+
+
+def history_path(path: str) -> str:
+    """Accept either a lists/ folder or the log file itself."""
+    return os.path.join(path, HISTORY_NAME) if os.path.isdir(path) else path
+
+
+def _members(data: bytes):
+    """
+    Yield (end offset, records) for each gzip member of `data` in order, stopping at the
+    first one that is torn or doesn't hold valid JSON lines.
+    """
+    view = memoryview(data)
+    pos = 0
+    while pos < len(data):
+        d = zlib.decompressobj(wbits=31)  # one gzip member
+        out = []
+        fed = pos
+        try:
+            while not d.eof and fed < len(data):
+                chunk = view[fed:fed + READ_CHUNK]
+                out.append(d.decompress(chunk))
+                fed += len(chunk)
+            if not d.eof:
+                return
+            recs = [json.loads(line) for line in b"".join(out).decode("utf-8").splitlines() if line.strip()]
+        except (zlib.error, ValueError):
+            return
+        pos = fed - len(d.unused_data)
+        yield pos, recs
+
+
+def _scan(path: str) -> tuple[list, int, int]:
+    """(intact records, byte offset where they end, file size)."""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return [], 0, 0
+    recs, end = [], 0
+    for end, member in _members(data):
+        recs += member
+    return recs, end, len(data)
+
+
+def read_runs(path: str):
+    """Yield run records in order, up to the first damaged one (a crash mid-append)."""
+    recs, end, size = _scan(path)
+    if end < size:
+        print(f"[warn] {path}: stopped at a damaged record after {len(recs)} runs "
+              f"({size - end} bytes unreadable).")
+    yield from recs
+
+
+def _replay(records):
+    ids, titles = set(), {}
+    for rec in records:
+        ids.difference_update(rec.get("removed", []))
+        ids.update(rec.get("added", []))
+        for mid in rec.get("removed", []):
+            titles.pop(mid, None)
+        titles.update(rec.get("titles", {}))
+        yield rec, ids, titles
+
+
+def replay(path: str):
+    """Yield (record, ids, titles) after applying each run; ids/titles are live objects, copy to keep."""
+    return _replay(read_runs(path))
+
+
+def state_at(path: str, run: int):
+    """(record, ids, titles) as of run number `run` (negative counts from the end), or None."""
+    if run < 0:
+        total = sum(1 for _ in read_runs(path))
+        run = total + run
+    for rec, ids, titles in replay(path):
+        if rec["run"] == run:
+            return rec, set(ids), dict(titles)
+    return None
+
+
+def _last_state(records) -> tuple[int, set, dict]:
+    n, ids, titles = 0, set(), {}
+    for rec, ids, titles in _replay(records):
+        n = rec["run"] + 1
+    return n, set(ids), dict(titles)
+
+
+def last_state(path: str) -> tuple[int, set, dict]:
+    """(next run number, ids, titles) after the latest run."""
+    return _last_state(read_runs(path))
+
+
+def append_run(path: str, ids, titles: dict, **meta) -> dict:
+    """
+    Append one run as a delta against the previous one. Returns the record written.
+    A damaged tail is cut off first (and kept beside the log), so the new record
+    follows the last intact one and stays readable.
+    """
+    recs, end, size = _scan(path)
+    if end < size:
+        aside = stem = f"{path}.damaged-{datetime.now():%Y%m%d-%H%M%S}"
+        n = 1
+        while os.path.exists(aside):
+            n += 1
+            aside = f"{stem}-{n}"
+        with open(path, "r+b") as f:
+            f.seek(end)
+            tail = f.read()
+            with open(aside, "wb") as out:
+                out.write(tail)
+            f.truncate(end)
+        print(f"[warn] {path}: {len(tail)} damaged bytes after {len(recs)} intact runs moved to {aside}; "
+              f"appending after the last intact run.")
+    n, prev_ids, prev_titles = _last_state(recs)
+    ids = {str(i) for i in ids}
+    rec = {
+        "run": n,
+        "time": datetime.now().isoformat(timespec="seconds"),
+        **meta,
+        "count": len(ids),
+        "added": sorted(ids - prev_ids),
+        "removed": sorted(prev_ids - ids),
+        "titles": {mid: t for mid, t in sorted(titles.items())
+                   if mid in ids and t and prev_titles.get(mid) != t},
+    }
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "ab") as f:
+        f.write(gzip.compress((json.dumps(rec, ensure_ascii=False) + "\n").encode("utf-8")))
+    return rec
+
+
+def read_titles_file(path: str) -> dict:
+    """{ id: title } from an ids_titles.txt; empty if missing."""
+    out = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            for line in f:
+                mid, _, title = line.rstrip("\n").partition("\t")
+                if mid.strip().isdigit():
+                    out[mid.strip()] = title
+    return out
+
+
+def export_run(path: str, run: int, out_dir: str) -> int | None:
+    """Write ids.txt, ids_titles.txt and urls.txt for one run into out_dir. Returns the ID count."""
+    got = state_at(path, run)
+    if got is None:
+        return None
+    _, ids, titles = got
+    ids = sorted(ids)
+    os.makedirs(out_dir, exist_ok=True)
+    for name, lines in (("ids.txt", ids),
+                        ("ids_titles.txt", [f"{mid}\t{titles.get(mid, '')}" for mid in ids]),
+                        ("urls.txt", [ITEM_URL.format(mid) for mid in ids])):
+        with open(os.path.join(out_dir, name), "w", encoding="utf-8") as f:
+            f.write("\n".join(lines))
+    return len(ids)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Query the compact scrape history (lists/history.jsonl.gz).")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("list", help="one line per run")
+    p.add_argument("path")
+    p = sub.add_parser("export", help="rebuild a past run's lists")
+    p.add_argument("path")
+    p.add_argument("run", type=int)
+    p.add_argument("-o", "--out", help="output folder (default: <lists>/export run <N>)")
+    p = sub.add_parser("diff", help="IDs added/removed between two runs")
+    p.add_argument("path")
+    p.add_argument("a", type=int)
+    p.add_argument("b", type=int)
+    args = ap.parse_args()
+
+    path = history_path(args.path)
+    if not os.path.exists(path):
+        print(f"No history at {path}")
+        return 1
+
+    if args.cmd == "list":
+        for rec in read_runs(path):
+            print(f"{rec['run']:>5}  {rec['time']}  {rec['count']:>7} IDs  "
+                  f"+{len(rec['added'])} -{len(rec['removed'])}  {rec.get('source', '')}")
+        return 0
+
+    if args.cmd == "export":
+        got = state_at(path, args.run)
+        if got is None:
+            print(f"No run {args.run}.")
+            return 1
+        out = args.out or os.path.join(os.path.dirname(path), f"export run {got[0]['run']}")
+        n = export_run(path, got[0]["run"], out)
+        print(f"✅ Run {got[0]['run']} ({got[0]['time']}): {n} IDs written to {out}")
+        return 0
+
+    a, b = state_at(path, args.a), state_at(path, args.b)
+    if a is None or b is None:
+        print("Unknown run number.")
+        return 1
+    added, removed = sorted(b[1] - a[1]), sorted(a[1] - b[1])
+    print(f"Run {a[0]['run']} → {b[0]['run']}: +{len(added)} -{len(removed)}")
+    for mid in added:
+        print(f"+{mid}\t{b[2].get(mid, '')}")
+    for mid in removed:
+        print(f"-{mid}\t{a[2].get(mid, '')}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,235 @@
+"""
+Per-run timings and counters for "steamworkshop id downloader.py", "steamcmd automation.py"
+and workshop_jobs.py.
+
+    with run_metrics.phase("crawl") as ph:
+        ids = fetch_ids(...)
+        ph["items"] = len(ids)
+    run_metrics.count("pages")
+
+A phase records wall time, calls and items (hence items/s); phases may nest, and repeated
+phases add up. Counters are plain sums fed from steam_http (HTTP requests, bytes, throttle
+retries, cache hits), workshop_meta (detail cache hits/fetches) and the SteamCMD runner.
+write() saves "<date> <script>.json" and a Prometheus textfile "steam_workshop_<script>.prom"
+(replaced atomically, for node_exporter's textfile collector).
+
+Profiling is opt-in per phase (start(profile="crawl,plan" or "all")): cProfile stats go to
+"<date> <script> <phase>.prof" (read with `python -m pstats`), and with memory=True the
+phase runs under tracemalloc and its top allocations go to "<date> <script> <phase>.mem.txt".
+Only one phase is profiled at a time (from Python 3.12 cProfile is process-wide): a phase
+entered while another is being profiled, in any thread, runs unprofiled, and so does one
+entered under an outside profiler. cProfile only sees the thread that entered the phase.
+"""
+import os
+import json
+import time
+import cProfile
+import threading
+import contextlib
+import tracemalloc
+from datetime import datetime
+
+PROM_PREFIX = "steam_workshop"
+TOP_ALLOCS = 25  # lines listed in a .mem.txt
+
+_profiler = threading.Lock()  # held by the one phase currently under cProfile
+
+
+class RunMetrics:
+    """Phases, counters and gauges for one run; safe to update from several threads."""
+
+    def __init__(self, script: str = "run", profile: str = "", memory: bool = False):
+        self.script = script
+        self.started = time.time()
+        self.phases = {}    # name -> {seconds, calls[, items][, peak_bytes]}
+        self.counters = {}  # name -> sum
+        self.gauges = {}    # name -> last value
+        self.profiles = []  # (phase, "prof" | "mem", cProfile.Profile | tracemalloc.Snapshot) not yet saved
+        self.saved = {}     # (phase, kind) -> profiles saved so far, for numbering repeats
+        self.profile = {p.strip() for p in str(profile or "").split(",") if p.strip()}
+        self.memory = bool(memory)
+        self.folder = None  # where write() puts the report; set once the run's folder is known
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def phase(self, name: str, items: int | None = None):
+        """Time the block; set rec["items"] inside it to report throughput."""
+        rec = {"items": items}
+        prof = None
+        # a phase inside a profiled one is covered by the outer profile
+        if ("all" in self.profile or name in self.profile) and _profiler.acquire(blocking=False):
+            prof = cProfile.Profile()
+            try:
+                prof.enable()
+            except ValueError:  # "Another profiling tool is already active"
+                prof = None
+                _profiler.release()
+        traced = bool(prof) and self.memory and not tracemalloc.is_tracing()
+        if traced:
+            tracemalloc.start()
+        t = time.perf_counter()
+        try:
+            yield rec
+        finally:
+            seconds = time.perf_counter() - t
+            if prof:
+                prof.disable()
+                _profiler.release()
+            snapshot = peak = None
+            if traced:
+                peak = tracemalloc.get_traced_memory()[1]
+                snapshot = tracemalloc.take_snapshot()
+                tracemalloc.stop()
+            with self.lock:
+                p = self.phases.setdefault(name, {"seconds": 0.0, "calls": 0})
+                p["seconds"] += seconds
+                p["calls"] += 1
+                if rec.get("items") is not None:
+                    p["items"] = p.get("items", 0) + int(rec["items"])
+                if peak is not None:
+                    p["peak_bytes"] = max(p.get("peak_bytes", 0), peak)
+                if prof:
+                    self.profiles.append((name, "prof", prof))
+                if snapshot:
+                    self.profiles.append((name, "mem", snapshot))
+
+    def count(self, name: str, n: float = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name: str, value: float):
+        with self.lock:
+            self.gauges[name] = value
+
+    def report(self) -> dict:
+        finished = time.time()
+        with self.lock:
+            phases = {}
+            for name, p in self.phases.items():
+                phases[name] = dict(p, seconds=round(p["seconds"], 4))
+                if p.get("items") and p["seconds"] > 0:
+                    phases[name]["items_per_second"] = round(p["items"] / p["seconds"], 2)
+            return {
+                "script": self.script,
+                "started": datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+                "finished": datetime.fromtimestamp(finished).isoformat(timespec="seconds"),
+                "seconds": round(finished - self.started, 3),
+                "phases": phases,
+                "counters": {k: round(v, 4) if isinstance(v, float) else v for k, v in sorted(self.counters.items())},
+                "gauges": dict(sorted(self.gauges.items())),
+            }
+
+    def summary_line(self, report: dict | None = None) -> str:
+        """One line per run for the console: each phase's time and throughput."""
+        report = report or self.report()
+        parts = []
+        for name, p in report["phases"].items():
+            s = f"{name} {p['seconds']:.1f}s"
+            if "items_per_second" in p:
+                s += f" ({p['items']} @ {p['items_per_second']:.0f}/s)"
+            parts.append(s)
+        c = report["counters"]
+        if c.get("http_requests"):
+            parts.append(f"{c['http_requests']} HTTP requests")
+        return f"[metrics] {report['seconds']:.1f}s total — " + " | ".join(parts)
+
+    def write(self, folder: str | None = None, prom_dir: str | None = None) -> str | None:
+        """
+        Write the JSON report, the .prom file and profiles taken since the last write.
+        Can be called repeatedly (e.g. each watch round); the report is rewritten in place.
+        Returns the JSON path, or None if no folder is known yet.
+        """
+        folder = folder or self.folder
+        if not folder:
+            return None
+        report = self.report()
+        stamp = datetime.fromtimestamp(self.started).strftime("%Y-%m-%d %H-%M-%S")
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"{stamp} {self.script}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+
+        prom_dir = prom_dir or folder
+        os.makedirs(prom_dir, exist_ok=True)
+        prom = os.path.join(prom_dir, f"{PROM_PREFIX}_{self.script}.prom")
+        with open(prom + ".tmp", "w", encoding="utf-8") as f:
+            f.write(prometheus_text(report))
+        os.replace(prom + ".tmp", prom)
+
+        with self.lock:
+            profiles, self.profiles = self.profiles, []
+        for name, kind, obj in profiles:
+            self.saved[(name, kind)] = n = self.saved.get((name, kind), 0) + 1
+            base = os.path.join(folder, f"{stamp} {self.script} {name}" + (f" {n}" if n > 1 else ""))
+            if kind == "prof":
+                obj.dump_stats(base + ".prof")
+            else:
+                with open(base + ".mem.txt", "w", encoding="utf-8") as f:
+                    for stat in obj.statistics("lineno")[:TOP_ALLOCS]:
+                        f.write(f"{stat}\n")
+            print(f"[metrics] {name}: profile saved to {base}{'.prof' if kind == 'prof' else '.mem.txt'}")
+        return path
+
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _metric_name(name: str) -> str:
+    return "".join(ch if ch.isalnum() else "_" for ch in name.lower())
+
+
+def prometheus_text(report: dict) -> str:
+    """A report in the Prometheus text exposition format (every value is a gauge of the last run)."""
+    script = f'script="{_label(report["script"])}"'
+    lines = []
+
+    def metric(name, help_text, samples):
+        lines.append(f"# HELP {PROM_PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {PROM_PREFIX}_{name} gauge")
+        for labels, value in samples:
+            lines.append(f"{PROM_PREFIX}_{name}{{{labels}}} {value}")
+
+    metric("run_seconds", "Wall time of the last run.", [(script, report["seconds"])])
+    metric("last_run_timestamp_seconds", "When the last run finished (Unix time).", [(script, int(time.time()))])
+    phases = report["phases"].items()
+    if phases:
+        metric("phase_seconds", "Wall time per phase in the last run.",
+               [(f'{script},phase="{_label(n)}"', p["seconds"]) for n, p in phases])
+        metric("phase_calls", "Times each phase ran in the last run.",
+               [(f'{script},phase="{_label(n)}"', p["calls"]) for n, p in phases])
+        with_items = [(n, p) for n, p in phases if "items" in p]
+        if with_items:
+            metric("phase_items", "Items handled per phase in the last run.",
+                   [(f'{script},phase="{_label(n)}"', p["items"]) for n, p in with_items])
+            metric("phase_items_per_second", "Throughput per phase in the last run.",
+                   [(f'{script},phase="{_label(n)}"', p.get("items_per_second", 0)) for n, p in with_items])
+        peaks = [(n, p) for n, p in phases if "peak_bytes" in p]
+        if peaks:
+            metric("phase_peak_bytes", "Peak traced memory per profiled phase.",
+                   [(f'{script},phase="{_label(n)}"', p["peak_bytes"]) for n, p in peaks])
+    for name, value in list(report["counters"].items()) + list(report["gauges"].items()):
+        metric(_metric_name(name), f"{name} in the last run.", [(script, value)])
+    return "\n".join(lines) + "\n"
+
+
+current = RunMetrics()
+
+
+def start(script: str, profile: str = "", memory: bool = False) -> RunMetrics:
+    """Begin a fresh run; the module-level helpers below record into it."""
+    global current
+    current = RunMetrics(script, profile, memory)
+    return current
+
+
+def phase(name: str, items: int | None = None):
+    return current.phase(name, items)
+
+
+def count(name: str, n: float = 1):
+    current.count(name, n)
+
+
+def gauge(name: str, value: float):
+    current.gauge(name, value)
@@ -0,0 +1,319 @@
+import os
+import json
+import gzip
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+import run_metrics
+
+# Shared pacing for all Steam HTTP traffic: one adaptive token bucket per host.
+# Rates creep up while Steam answers normally and halve on 429/5xx (honouring Retry-After).
+
+START_RATES = {                  # requests per second to start from
+    "steamcommunity.com": 2.5,
+    "api.steampowered.com": 5.0,
+}
+DEFAULT_RATE = 2.5
+MIN_RATE = 0.2
+MAX_RATE = 20.0
+THROTTLE_RETRIES = 5             # re-sends of a request answered with 429/5xx
+MEM_CACHE_ENTRIES = 32           # most recently used pages an HttpCache keeps in memory
+DISK_CACHE_MAX_AGE = 14 * 86400  # seconds an unused page stays in an HttpCache folder
+DISK_CACHE_MAX_BYTES = 256 << 20 # size an HttpCache folder is trimmed to (oldest pages first)
+
+
+class RateLimiter:
+    """Token bucket whose refill rate grows additively on success and halves on throttling."""
+
+    def __init__(self, rate: float = DEFAULT_RATE, min_rate: float = MIN_RATE,
+                 max_rate: float = MAX_RATE, step: float = 0.1):
+        self.rate = float(rate)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.step = step
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(max(1.0, self.rate), self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Block until a request may be sent."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.step)
+
+    def throttle(self, retry_after: float | None = None):
+        """Back off: halve the rate and pause the bucket for Retry-After (or one new interval)."""
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            pause = retry_after if retry_after is not None else 1 / self.rate
+            self.blocked_until = max(self.blocked_until, time.monotonic() + pause)
+            self.tokens = 0.0
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def _host_key(host: str) -> str:
+    host = (host or "").lower()
+    for key in START_RATES:
+        if host == key or host.endswith("." + key):
+            return key
+    return host
+
+def limiter_for(url_or_host: str) -> RateLimiter:
+    """The shared limiter for a URL's host (created on first use)."""
+    host = urlparse(url_or_host).hostname if "://" in url_or_host else url_or_host
+    key = _host_key(host)
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = RateLimiter(START_RATES.get(key, DEFAULT_RATE))
+        return _limiters[key]
+
+def set_start_rate(host: str, rate: float):
+    """Override the starting rate for a host (e.g. from a script's CONFIG)."""
+    limiter_for(host).rate = max(MIN_RATE, min(MAX_RATE, float(rate)))
+
+def current_rate(url_or_host: str) -> float:
+    return limiter_for(url_or_host).rate
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Retry-After is either delta-seconds or an HTTP date."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """HTTPAdapter that paces every request through limiter_for(host) and re-sends on 429/5xx."""
+
+    def __init__(self, *args, throttle_retries: int = THROTTLE_RETRIES, **kwargs):
+        self.throttle_retries = throttle_retries
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        limiter = limiter_for(request.url)
+        attempt = 0
+        while True:
+            limiter.acquire()
+            resp = super().send(request, **kwargs)
+            run_metrics.count("http_requests")
+            length = resp.headers.get("Content-Length", "")
+            if length.isdigit():
+                run_metrics.count("http_bytes", int(length))
+            if resp.status_code != 429 and resp.status_code < 500:
+                limiter.success()
+                return resp
+            limiter.throttle(parse_retry_after(resp.headers.get("Retry-After")))
+            if attempt >= self.throttle_retries:
+                run_metrics.count("http_gave_up")
+                return resp
+            attempt += 1
+            run_metrics.count("http_retries")
+            print(f"[rate] HTTP {resp.status_code} from {urlparse(request.url).hostname} — "
+                  f"backing off to {limiter.rate:.2f} req/s (retry {attempt}/{self.throttle_retries})")
+            resp.close()
+
+
+def mount_limited(session, pool_size: int = 1):
+    """Mount a pooled RateLimitedAdapter on a requests.Session for http and https."""
+    adapter = RateLimitedAdapter(pool_connections=max(1, pool_size), pool_maxsize=max(1, pool_size))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+_pruned = set()  # cache folders already pruned by this process
+_pruned_lock = threading.Lock()
+
+
+class HttpCache:
+    """
+    GET response cache: a small in-memory LRU for repeats within a run (page 1 is read
+    for the AppID, the game name and the crawl), plus an on-disk copy (only for responses
+    carrying ETag/Last-Modified) used for conditional requests on later runs. `folder`
+    should already be namespaced (e.g. per cookie mode). The folder is pruned once per
+    process: pages unused for `max_age` seconds go, then the least recently used until
+    it is under `max_bytes` (0 disables either limit).
+    """
+
+    KEEP_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+
+    def __init__(self, folder: str | None, mem_entries: int = MEM_CACHE_ENTRIES,
+                 max_age: float = DISK_CACHE_MAX_AGE, max_bytes: int = DISK_CACHE_MAX_BYTES):
+        self.folder = folder
+        self.mem = OrderedDict()
+        self.mem_entries = max(0, int(mem_entries))
+        self.lock = threading.Lock()
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+            with _pruned_lock:
+                first = folder not in _pruned
+                _pruned.add(folder)
+            if first:
+                self.prune(max_age, max_bytes)
+
+    def prune(self, max_age: float, max_bytes: int) -> int:
+        """Drop cached pages by age, then by total size (least recently written first). Returns pages removed."""
+        pages = {}  # hash -> [last written, bytes, paths]
+        try:
+            with os.scandir(self.folder) as it:
+                for e in it:
+                    h, dot, _ = e.name.partition(".")
+                    if not dot or not e.is_file():
+                        continue
+                    st = e.stat()
+                    p = pages.setdefault(h, [0.0, 0, []])
+                    p[0] = max(p[0], st.st_mtime)
+                    p[1] += st.st_size
+                    p[2].append(e.path)
+        except OSError:
+            return 0
+        now = time.time()
+        total = sum(p[1] for p in pages.values())
+        removed = 0
+        for mtime, size, paths in sorted(pages.values()):
+            if not (max_age and now - mtime > max_age) and not (max_bytes and total > max_bytes):
+                break
+            for path in paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+            removed += 1
+        return removed
+
+    def _paths(self, url):
+        h = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.folder, h + ".json"), os.path.join(self.folder, h + ".body.gz")
+
+    def get_mem(self, url):
+        with self.lock:
+            entry = self.mem.get(url)
+            if entry is not None:
+                self.mem.move_to_end(url)
+            return entry
+
+    def get_disk(self, url):
+        if not self.folder:
+            return None
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with gzip.open(body_path, "rb") as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        if meta.get("url") != url:
+            return None
+        return {"headers": meta.get("headers", {}), "body": body}
+
+    def put(self, url, headers, body):
+        entry = {"headers": {k: headers[k] for k in self.KEEP_HEADERS if k in headers}, "body": body}
+        if self.mem_entries:
+            with self.lock:
+                self.mem[url] = entry
+                self.mem.move_to_end(url)
+                while len(self.mem) > self.mem_entries:
+                    self.mem.popitem(last=False)
+        if self.folder and ("ETag" in headers or "Last-Modified" in headers):
+            meta_path, body_path = self._paths(url)
+            try:
+                with gzip.open(body_path, "wb", compresslevel=3) as f:
+                    f.write(body)
+                with open(meta_path, "w", encoding="utf-8") as f:
+                    json.dump({"url": url, "headers": entry["headers"]}, f)
+            except OSError as e:
+                print(f"[warn] HTTP cache write failed: {e}")
+        return entry
+
+
+class CachingAdapter(RateLimitedAdapter):
+    """RateLimitedAdapter that answers repeated GETs from an HttpCache and revalidates disk copies."""
+
+    def __init__(self, cache: HttpCache, *args, **kwargs):
+        self.cache = cache
+        self.hits = 0
+        self.revalidated = 0
+        super().__init__(*args, **kwargs)
+
+    def _from_cache(self, request, entry):
+        r = Response()
+        r.status_code = 200
+        r.reason = "OK"
+        r.headers = CaseInsensitiveDict(entry["headers"])
+        r._content = entry["body"]
+        r._content_consumed = True
+        r.encoding = get_encoding_from_headers(r.headers)
+        r.url = request.url
+        r.request = request
+        r.connection = self
+        r.from_cache = True
+        return r
+
+    def send(self, request, **kwargs):
+        if request.method != "GET":
+            return super().send(request, **kwargs)
+        url = request.url
+        entry = self.cache.get_mem(url)
+        if entry is not None:
+            self.hits += 1
+            run_metrics.count("http_cache_hits")
+            return self._from_cache(request, entry)
+
+        disk = self.cache.get_disk(url)
+        if disk is not None:
+            if "ETag" in disk["headers"]:
+                request.headers["If-None-Match"] = disk["headers"]["ETag"]
+            if "Last-Modified" in disk["headers"]:
+                request.headers["If-Modified-Since"] = disk["headers"]["Last-Modified"]
+
+        resp = super().send(request, **kwargs)
+        if resp.status_code == 304 and disk is not None:
+            self.revalidated += 1
+            run_metrics.count("http_revalidated")
+            resp.close()
+            return self._from_cache(request, self.cache.put(url, disk["headers"], disk["body"]))
+        if resp.status_code == 200 and "no-store" not in resp.headers.get("Cache-Control", ""):
+            self.cache.put(url, resp.headers, resp.content)
+        return resp
+
+
+def mount_cached(session, cache: HttpCache, pool_size: int = 1):
+    """Like mount_limited, but GETs go through `cache` first."""
+    adapter = CachingAdapter(cache, pool_connections=max(1, pool_size), pool_maxsize=max(1, pool_size))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
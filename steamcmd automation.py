@@ -1,15 +1,49 @@
 import os
 import re
 import json
+import mmap
 import time
-import requests
+import heapq
+import hashlib
+import shutil
 import subprocess
+import atexit
 import getpass
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from workshop_meta import get_details
+import run_metrics
 
 CONFIG = {
     "skip_already_downloaded": True,  # skip what’s already installed
     "check_updates": True,            # also skip if up to date (ACF vs remote)
-    "require_nonempty_on_disk": True  # only consider installed if folder has files/size
+    "require_nonempty_on_disk": True, # only consider installed if folder has files/size
+    "meta_ttl": 3600,                 # seconds a cached time_updated is trusted for update checks
+    "workers": 1,                     # parallel SteamCMD instances (each gets its own shard + install dir)
+    "chunk_size": 200,                # items per runscript (0 = one runscript for everything)
+    "chunk_timeout": 2 * 3600,        # seconds before a stuck SteamCMD run is killed (0 = never)
+    "max_retries": 3,                 # extra rounds for retryable failures
+    "retry_backoff": 30,              # seconds before the first retry round; doubles each round
+    "watch": False,                   # stay running: keep SteamCMD logged in and fetch updates as they appear
+    "watch_interval": 600,            # seconds between time_updated polls in watch mode
+    "login_timeout": 120,             # seconds to wait for the watch-mode SteamCMD to log in
+    "index_workers": 8,               # threads rescanning mod folders for the disk index
+    "integrity_check": False,         # hash installed mods and compare sizes with the Workshop's file_size
+    "hash_workers": 8,                # threads hashing files for the integrity check
+    "schedule": "listing",            # download order: "listing", "smallest" (fast visible progress) or "largest" (bin-packs shards)
+    "disk_policy": "warn",            # when the batch may not fit on the steamapps volume: "warn", "refuse" or "off"
+    "disk_reserve_gb": 2,             # free space to keep on top of the batch size
+    "dry_run": False,                 # only write download_plan.json and print the plan; don't download
+    "dedupe": False,                  # after downloading, store identical files across mods only once
+    "dedupe_mode": "auto",            # "reflink" (copy-on-write clones), "hardlink", or "auto" (reflink if supported)
+    "dedupe_min_size": 64 * 1024,     # bytes; smaller files aren't worth linking
+    "sync_targets": [],               # folders to mirror content/<appid> into after a run, e.g. ["D:/server/mods/{appid}"]
+    "sync_delete": True,              # remove mods from sync targets once they're no longer in ids.txt
+    "metrics": True,                  # save a run report (JSON + Prometheus .prom) in '<game folder>/reports'
+    "metrics_prom_dir": "",           # folder for the .prom file instead (e.g. node_exporter's textfile directory)
+    "profile": "",                    # phases to run under cProfile, comma-separated or "all": plan, acf, disk_index,
+                                      # integrity, details, download, dedupe, sync (watch mode: poll, download)
+    "profile_memory": False           # also trace allocations (tracemalloc) in the profiled phases
 }
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -17,6 +51,7 @@ OUTPUT_ROOT = os.path.join(SCRIPT_DIR, "0 - output")
 
 steamcmd_exe = os.path.join(SCRIPT_DIR, "steamcmd", "steamcmd.exe")
 RUN_DIR = os.path.join(SCRIPT_DIR, "steamcmd", "run")
+WORKSHOP_DIR = os.path.join(SCRIPT_DIR, "steamcmd", "steamapps", "workshop")
 os.makedirs(RUN_DIR, exist_ok=True)
 
 def read_ids(path):
@@ -30,12 +65,7 @@ def read_ids(path):
 
 def get_installed_ids(appid):
     """Return set of installed Workshop IDs from the app's ACF file."""
-    acf_path = os.path.join(SCRIPT_DIR, "steamcmd", "steamapps", "workshop", f"appworkshop_{appid}.acf")
-    if not os.path.exists(acf_path):
-        return set()
-    with open(acf_path, "r", encoding="utf-8", errors="ignore") as f:
-        text = f.read()
-    return set(re.findall(r'"(\d+)"\s*\{[^}]*"timeupdated"', text))
+    return set(installed_items(appid))
 
 def _find_modlink_folders():
     out = []
@@ -49,7 +79,7 @@ def _find_modlink_folders():
 
 def content_dir_for_app(appid: str) -> str:
     """Path where SteamCMD puts workshop content for appid."""
-    return os.path.join(SCRIPT_DIR, "steamcmd", "steamapps", "workshop", "content", str(appid))
+    return os.path.join(WORKSHOP_DIR, "content", str(appid))
 
 def mod_folder_path(appid: str, modid: str) -> str:
     return os.path.join(content_dir_for_app(appid), str(modid))
@@ -67,59 +97,1171 @@ def folder_has_content(path: str) -> bool:
                 pass
     return False
 
-def get_installed_map(appid: str) -> dict:
+def scan_mod_folder(path: str) -> dict:
+    """One scandir pass over a mod folder: { files, bytes, newest } (newest file mtime, seconds)."""
+    files = size = 0
+    newest = 0.0
+    stack = [path]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                        continue
+                    st = entry.stat()
+                except OSError:
+                    continue
+                files += 1
+                size += st.st_size
+                newest = max(newest, st.st_mtime)
+    return {"files": files, "bytes": size, "newest": newest}
+
+def disk_index_path(appid: str) -> str:
+    return os.path.join(RUN_DIR, f"disk_index_{appid}.json")
+
+def disk_index(appid: str, refresh: list[str] | None = None) -> dict[str, dict]:
     """
-    Parse appworkshop_<appid>.acf and return { id: timeupdated_int }.
+    Persisted { id: {files, bytes, newest, ...} } for content/<appid>, saved in RUN_DIR.
+    A full pass (refresh=None) lists content/<appid> once and rescans only folders whose
+    directory mtime/inode or ACF size/timeupdated changed since the last index.
+    With `refresh`, just those ids are rescanned (e.g. right after downloading them).
+    Rescans run on CONFIG["index_workers"] threads.
     """
-    acf_path = os.path.join(SCRIPT_DIR, "steamcmd", "steamapps", "workshop", f"appworkshop_{appid}.acf")
-    if not os.path.isfile(acf_path):
-        return {}
-    with open(acf_path, "r", encoding="utf-8", errors="ignore") as f:
-        txt = f.read()
+    path = disk_index_path(appid)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            index = json.load(f).get("items", {})
+    except (OSError, ValueError):
+        index = {}
 
-    out = {}
-    # Match blocks like:  "<id>" { ... "timeupdated" "<num>" ... }
-    for m in re.finditer(r'"\s*(\d{6,})\s*"\s*{\s*([^}]*)}', txt, flags=re.S):
-        mid = m.group(1)
-        block = m.group(2)
-        tu = 0
-        mt = re.search(r'"\s*timeupdated\s*"\s*"\s*(\d+)\s*"', block)
-        if mt:
+    acf = installed_items(appid)
+    root = content_dir_for_app(appid)
+    folders = {}  # id -> (stamp, path)
+    gone = 0
+    if refresh is None:
+        try:
+            with os.scandir(root) as it:
+                for entry in it:
+                    if entry.name.isdigit() and entry.is_dir(follow_symlinks=False):
+                        st = entry.stat(follow_symlinks=False)
+                        folders[entry.name] = ([st.st_mtime_ns, st.st_ino], entry.path)
+        except OSError:
+            pass
+        gone = len(index)
+        index = {mid: rec for mid, rec in index.items() if mid in folders}
+        gone -= len(index)
+    else:
+        for mid in refresh:
+            mpath = mod_folder_path(appid, mid)
             try:
-                tu = int(mt.group(1))
-            except:
-                tu = 0
-        out[mid] = tu
+                st = os.stat(mpath)
+                folders[mid] = ([st.st_mtime_ns, st.st_ino], mpath)
+            except OSError:
+                gone += index.pop(mid, None) is not None
+
+    todo = []
+    for mid, (stamp, mpath) in folders.items():
+        rec = acf.get(mid)
+        acf_stamp = [rec["size"], rec["timeupdated"]] if rec else None
+        old = index.get(mid)
+        if refresh is not None or not old or old.get("stamp") != stamp or old.get("acf") != acf_stamp:
+            todo.append((mid, stamp, acf_stamp, mpath))
+
+    if todo:
+        def rescan(job):
+            mid, stamp, acf_stamp, mpath = job
+            return mid, {"stamp": stamp, "acf": acf_stamp, **scan_mod_folder(mpath)}
+        with ThreadPoolExecutor(max_workers=max(1, int(CONFIG.get("index_workers", 8) or 1))) as ex:
+            index.update(ex.map(rescan, todo))
+        if refresh is None:
+            print(f"[disk] Indexed {len(folders)} mod folders ({len(todo)} rescanned).")
+
+    if not todo and not gone:
+        return index
+    tmp = path + ".tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"appid": str(appid), "items": index}, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"[warn] Could not save disk index: {e}")
+    return index
+
+def has_content(index: dict[str, dict], mid: str) -> bool:
+    """Disk-index equivalent of folder_has_content()."""
+    return index.get(mid, {}).get("bytes", 0) > 0
+
+MANIFEST_DIR = os.path.join(RUN_DIR, "manifests")
+
+def hash_file(path: str) -> str:
+    """blake2b-128 of a file, read through mmap (hashlib releases the GIL, so threads run in parallel)."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        try:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                h.update(mm)
+        except ValueError:  # empty files can't be mapped
+            pass
+    return h.hexdigest()
+
+def list_mod_files(path: str) -> dict[str, tuple[int, int]]:
+    """{ relative/path: (size, mtime_ns) } for every file under a mod folder."""
+    out = {}
+    stack = [path]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                        continue
+                    st = entry.stat()
+                except OSError:
+                    continue
+                out[os.path.relpath(entry.path, path).replace(os.sep, "/")] = (st.st_size, st.st_mtime_ns)
     return out
 
+def manifest_path(appid: str, mid: str) -> str:
+    return os.path.join(MANIFEST_DIR, str(appid), f"{mid}.json")
+
+def load_manifest(appid: str, mid: str) -> dict:
+    try:
+        with open(manifest_path(appid, mid), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(appid: str, mid: str, manifest: dict):
+    path = manifest_path(appid, mid)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, path)
+
+def integrity_check(appid: str, ids: list[str]) -> dict[str, str]:
+    """
+    Build/refresh a manifest { path: [size, mtime_ns, hash] } per mod, hashing only files
+    whose size or mtime changed, on CONFIG["hash_workers"] threads. A mod fails when its
+    total size differs from the Workshop's file_size, or when files went missing or changed
+    while the ACF still reports the version the manifest was made from.
+    Manifests are saved only for mods that pass. Returns { id: reason } for the failures.
+    """
+    acf = installed_items(appid)
+    remote = get_details(ids, ttl=CONFIG.get("meta_ttl", 0))
+    mods = {}   # id -> (files, old manifest)
+    jobs = []   # (id, rel, full path)
+    for mid in ids:
+        folder = mod_folder_path(appid, mid)
+        files = list_mod_files(folder)
+        old = load_manifest(appid, mid)
+        old_files = old.get("files", {})
+        for rel, (size, mtime) in files.items():
+            prev = old_files.get(rel)
+            if not prev or prev[0] != size or prev[1] != mtime:
+                jobs.append((mid, rel, os.path.join(folder, rel)))
+        mods[mid] = (files, old)
+
+    hashes = {}
+    if jobs:
+        def run(job):
+            mid, rel, full = job
+            try:
+                return mid, rel, hash_file(full)
+            except OSError:
+                return mid, rel, None
+        with ThreadPoolExecutor(max_workers=max(1, int(CONFIG.get("hash_workers", 8) or 1))) as ex:
+            for mid, rel, digest in ex.map(run, jobs):
+                hashes[(mid, rel)] = digest
+
+    bad = {}
+    for mid, (files, old) in mods.items():
+        old_files = old.get("files", {})
+        same_version = bool(old) and old.get("timeupdated") == acf.get(mid, {}).get("timeupdated")
+        manifest = {}
+        for rel, (size, mtime) in files.items():
+            digest = hashes.get((mid, rel), old_files.get(rel, [None, None, None])[2])
+            manifest[rel] = [size, mtime, digest]
+        total = sum(size for size, _ in files.values())
+        expected = remote.get(mid, {}).get("file_size", 0)
+        if expected and total != expected:
+            bad[mid] = f"size mismatch ({total} bytes local, {expected} on Workshop)"
+        elif any(digest is None for _, _, digest in manifest.values()):
+            bad[mid] = "unreadable files"
+        elif same_version and set(old_files) - set(manifest):
+            bad[mid] = "files missing since last check"
+        elif same_version and any(old_files[rel][2] != manifest[rel][2] for rel in manifest if rel in old_files):
+            bad[mid] = "content changed without an update"
+        else:
+            save_manifest(appid, mid, {"timeupdated": acf.get(mid, {}).get("timeupdated", 0), "files": manifest})
+    print(f"[integrity] {len(ids)} mods checked, {len(jobs)} files hashed, {len(bad)} failed.")
+    return bad
+
+DEDUPE_STORE = os.path.join(SCRIPT_DIR, "steamcmd", "dedupe_store")  # must be on the steamapps volume
+FICLONE = 0x40049409  # Linux ioctl: share a file's extents (btrfs, XFS)
+
+def _reflink(src: str, dst: str) -> bool:
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(src, "rb") as fs, open(dst, "wb") as fd:
+            fcntl.ioctl(fd.fileno(), FICLONE, fs.fileno())
+        return True
+    except OSError:
+        try:
+            os.remove(dst)
+        except OSError:
+            pass
+        return False
+
+def dedupe_content(appid: str) -> dict:
+    """
+    Content-addressed dedupe of content/<appid>: every file of at least CONFIG["dedupe_min_size"]
+    is hashed and kept once under DEDUPE_STORE/<appid>/<aa>/<hash>, and identical copies in
+    other mods become reflinks or hardlinks of that entry (CONFIG["dedupe_mode"]).
+    Mods whose folder, timeupdated and timetouched are unchanged since the last pass are skipped;
+    store entries no mod references any more are pruned.
+    Hardlinks share one inode, so a tool editing files in place would change every copy
+    (SteamCMD replaces files on update, which just breaks the link); reflinks don't have that caveat.
+    Sizes on disk, the ACF and the disk index look the same as before, so update detection and
+    the empty-folder checks keep working. Returns { mods, files, linked, reclaimed, pruned }.
+    """
+    mode = CONFIG.get("dedupe_mode", "auto")
+    min_size = max(1, int(CONFIG.get("dedupe_min_size", 0) or 0))
+    store = os.path.join(DEDUPE_STORE, str(appid))
+    state_path = os.path.join(RUN_DIR, f"dedupe_{appid}.json")
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+
+    acf = installed_items(appid)
+    index = disk_index(appid)
+
+    def stamp_of(mid):
+        item = acf.get(mid, {})
+        return [index.get(mid, {}).get("stamp"), item.get("timeupdated", 0), item.get("timetouched", 0)]
+
+    state = {mid: st for mid, st in state.items() if mid in index}
+    todo = [mid for mid in index if state.get(mid, {}).get("stamp") != stamp_of(mid)]
+
+    jobs = []
+    for mid in todo:
+        folder = mod_folder_path(appid, mid)
+        for rel, (size, _) in list_mod_files(folder).items():
+            if size >= min_size:
+                jobs.append((mid, os.path.join(folder, rel)))
+
+    def run(job):
+        mid, full = job
+        try:
+            return mid, full, hash_file(full)
+        except OSError:
+            return mid, full, None
+
+    with ThreadPoolExecutor(max_workers=max(1, int(CONFIG.get("hash_workers", 8) or 1))) as ex:
+        results = list(ex.map(run, jobs))
+
+    use_reflink = mode in ("auto", "reflink")
+    linked = reclaimed = 0
+    digests = {mid: set() for mid in todo}
+    unfinished = set()  # mods with a file that wasn't hashed/linked; scanned again next pass
+    for i, (mid, full, digest) in enumerate(results):
+        if digest is None:
+            unfinished.add(mid)
+            continue
+        digests[mid].add(digest)
+        entry = os.path.join(store, digest[:2], digest)
+        try:
+            st = os.stat(full)
+            if not os.path.exists(entry):
+                os.makedirs(os.path.dirname(entry), exist_ok=True)
+                if use_reflink and _reflink(full, entry):
+                    continue
+                if mode == "reflink":
+                    print('[dedupe] This filesystem can\'t reflink — use dedupe_mode "hardlink" or "auto".')
+                    unfinished.update(m for m, _, _ in results[i:])
+                    break
+                use_reflink = False
+                os.link(full, entry)
+                continue
+            est = os.stat(entry)
+            if (est.st_dev, est.st_ino) == (st.st_dev, st.st_ino) or est.st_size != st.st_size:
+                continue
+            tmp = full + ".dedupe"
+            if use_reflink and _reflink(entry, tmp):
+                os.utime(tmp, ns=(st.st_atime_ns, st.st_mtime_ns))
+            else:
+                os.link(entry, tmp)
+            os.replace(tmp, full)
+            linked += 1
+            if use_reflink or st.st_nlink == 1:
+                reclaimed += st.st_size
+        except OSError as e:
+            print(f"[dedupe] {full}: {e}")
+            unfinished.add(mid)
+            if e.errno == 18:  # EXDEV: store and content on different volumes
+                unfinished.update(m for m, _, _ in results[i:])
+                break
+
+    # linking rewrote directory entries: take the post-pass stamps so these mods count as done
+    index = disk_index(appid, refresh=todo) if todo else index
+    for mid in todo:
+        if mid not in unfinished:
+            state[mid] = {"stamp": stamp_of(mid), "digests": sorted(digests[mid])}
+    referenced = {d for st in state.values() for d in st.get("digests", [])}
+    pruned = 0
+    if os.path.isdir(store):
+        for sub in os.scandir(store):
+            if sub.is_dir():
+                for entry in os.scandir(sub.path):
+                    if entry.name not in referenced:
+                        try:
+                            os.remove(entry.path)
+                            pruned += 1
+                        except OSError:
+                            pass
+
+    tmp = state_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, state_path)
+    print(f"[dedupe] {len(todo)} of {len(index)} mods scanned, {len(jobs)} files hashed, {linked} linked, "
+          f"{_fmt_bytes(reclaimed)} reclaimed, {pruned} unused store entries pruned.")
+    if unfinished:
+        print(f"[dedupe] {len(unfinished)} mods weren't fully processed; they're scanned again next pass.")
+    return {"mods": len(todo), "files": len(jobs), "linked": linked, "reclaimed": reclaimed, "pruned": pruned}
+
+def copy_file_fast(src: str, dst: str):
+    """Copy one file: reflink if the filesystem can, else in-kernel os.copy_file_range, else shutil."""
+    if _reflink(src, dst):
+        return
+    if hasattr(os, "copy_file_range"):
+        try:
+            with open(src, "rb") as fs, open(dst, "wb") as fd:
+                left = os.fstat(fs.fileno()).st_size
+                while left > 0:
+                    n = os.copy_file_range(fs.fileno(), fd.fileno(), left)
+                    if n <= 0:
+                        break
+                    left -= n
+            if left <= 0:
+                return
+        except OSError:
+            pass
+    shutil.copyfile(src, dst)
+
+def sync_mod(src: str, dst: str) -> tuple[int, int]:
+    """
+    Make dst mirror src: files whose size or mtime differ are copied (to a temp name, then
+    swapped in), files that no longer exist in src are removed. Returns (files copied, bytes).
+    """
+    want = list_mod_files(src)
+    have = list_mod_files(dst) if os.path.isdir(dst) else {}
+    copied = size = 0
+    for rel, (fsize, mtime) in want.items():
+        if have.get(rel) == (fsize, mtime):
+            continue
+        target = os.path.join(dst, rel)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp = target + ".sync"
+        copy_file_fast(os.path.join(src, rel), tmp)
+        os.utime(tmp, ns=(mtime, mtime))
+        os.replace(tmp, target)
+        copied += 1
+        size += fsize
+    for rel in set(have) - set(want):
+        try:
+            os.remove(os.path.join(dst, rel))
+        except OSError:
+            pass
+    return copied, size
+
+def sync_targets(appid: str, changed: list[str], keep: list[str], delete: bool | None = None):
+    """
+    Push content/<appid> to every CONFIG["sync_targets"] directory ("{appid}" is filled in),
+    one thread per target. Only `changed` mods, plus listed mods a target doesn't have yet,
+    are compared file by file; with `delete` (default CONFIG["sync_delete"]), mod folders not
+    in `keep` are removed — pass False when `keep` may not be the whole listing.
+    """
+    if delete is None:
+        delete = CONFIG.get("sync_delete", True)
+    targets = [t.replace("{appid}", str(appid)) for t in CONFIG.get("sync_targets") or []]
+    if not targets:
+        return
+    keep_set = set(keep)
+    index = disk_index(appid, refresh=list(changed)) if changed else disk_index(appid)
+
+    def push(target):
+        os.makedirs(target, exist_ok=True)
+        present = {e.name for e in os.scandir(target) if e.is_dir() and e.name.isdigit()}
+        todo = list(dict.fromkeys(list(changed) + [mid for mid in keep if mid not in present]))
+        todo = [mid for mid in todo if has_content(index, mid)]
+        files = size = removed = 0
+        errors = []
+        for mid in todo:
+            try:
+                c, b = sync_mod(mod_folder_path(appid, mid), os.path.join(target, mid))
+                files += c
+                size += b
+            except OSError as e:
+                errors.append(f"{mid}: {e}")
+        if delete:
+            for mid in present - keep_set:
+                shutil.rmtree(os.path.join(target, mid), ignore_errors=True)
+                removed += 1
+        return target, len(todo), files, size, removed, errors
+
+    with ThreadPoolExecutor(max_workers=len(targets)) as ex:
+        for target, mods, files, size, removed, errors in ex.map(push, targets):
+            print(f"[sync] {target}: {mods} mods checked, {files} files ({_fmt_bytes(size)}) copied, {removed} removed.")
+            for err in errors[:10]:
+                print(f"[sync]   ⚠️ {err}")
+
+def get_installed_map(appid: str) -> dict:
+    """
+    Parse appworkshop_<appid>.acf and return { id: timeupdated_int }.
+    """
+    return {mid: rec["timeupdated"] for mid, rec in installed_items(appid).items()}
+
 def fetch_remote_timeupdated(ids: list[str]) -> dict[str, int]:
     """
-    Call ISteamRemoteStorage/GetPublishedFileDetails to get each id's 'time_updated'.
-    Returns { id: time_updated_int }. Unknown → 0.
+    Each id's 'time_updated' from GetPublishedFileDetails, read through the shared
+    metadata cache (workshop_meta.sqlite3); only missing or stale rows hit the API.
+    Returns { id: time_updated_int }. Ids the API could not be reached for, or answered
+    with result != 1 (hidden, removed, a transient failure), are left out.
+    """
+    rows = get_details(ids, ttl=CONFIG.get("meta_ttl", 0))
+    return {mid: row["time_updated"] for mid, row in rows.items() if row["result"] == 1}
+
+# Plan reasons that mean "download it"; anything else ("up_to_date", "installed", "unknown") is skipped.
+FETCH_REASONS = ("new", "empty", "integrity", "outdated", "unchecked")
+
+def plan_downloads(appid: str, ids: list[str], index: dict | None = None) -> dict:
+    """
+    Reconcile the listed ids with the ACF, the disk index and remote time_updated, one
+    reason per id, in a single pass over the list (duplicates dropped, order kept):
+      new        – not in the ACF
+      empty      – in the ACF but the folder is empty/missing
+      integrity  – failed the optional integrity check
+      unknown    – installed, but the API had no usable time_updated for it (skipped; checked again next run)
+      outdated   – remote time_updated is newer than the ACF's
+      up_to_date / installed – skipped (installed = update check disabled)
+      unchecked  – CONFIG["skip_already_downloaded"] is off
+    `index` is a disk_index() to reuse (callers planning many small batches); by default
+    a fresh one is built. Returns { ids, pending, reasons, details, counts }.
+    """
+    ids = list(dict.fromkeys(ids))
+    reasons = {}
+    details = {}
+    if not CONFIG.get("skip_already_downloaded", True):
+        reasons = dict.fromkeys(ids, "unchecked")
+    else:
+        with run_metrics.phase("acf") as ph:
+            installed_map = get_installed_map(appid)  # {id: timeupdated_int}
+            ph["items"] = len(installed_map)
+        if not installed_map:
+            print("[acf] No ACF file or no installed mods found — proceeding with all IDs.")
+        if not CONFIG.get("require_nonempty_on_disk", True) or not installed_map:
+            index = None
+        elif index is None:
+            with run_metrics.phase("disk_index") as ph:
+                index = disk_index(appid)
+                ph["items"] = len(index)
+        for mid in ids:
+            if mid not in installed_map:
+                reasons[mid] = "new"
+            elif index is not None and not has_content(index, mid):
+                reasons[mid] = "empty"
+
+        present = [mid for mid in ids if mid not in reasons]
+        if present and CONFIG.get("integrity_check", False):
+            with run_metrics.phase("integrity", items=len(present)):
+                for mid, reason in integrity_check(appid, present).items():
+                    reasons[mid] = "integrity"
+                    details[mid] = reason
+            present = [mid for mid in present if mid not in reasons]
+
+        if present and CONFIG.get("check_updates", True):
+            with run_metrics.phase("details", items=len(present)):
+                remote_map = fetch_remote_timeupdated(present)
+            for mid in present:
+                if mid not in remote_map:
+                    reasons[mid] = "unknown"
+                elif remote_map[mid] > installed_map[mid]:
+                    reasons[mid] = "outdated"
+                else:
+                    reasons[mid] = "up_to_date"
+        else:
+            for mid in present:
+                reasons[mid] = "installed"
+
+    counts = {}
+    for reason in reasons.values():
+        counts[reason] = counts.get(reason, 0) + 1
+    pending = [mid for mid in ids if reasons[mid] in FETCH_REASONS]
+    return {"ids": ids, "pending": pending, "reasons": reasons, "details": details, "counts": counts}
+
+def write_plan(path: str, appid: str, plan: dict):
+    """Save a plan as JSON: one entry per id with its action and reason."""
+    items = []
+    for mid in plan["ids"]:
+        reason = plan["reasons"][mid]
+        item = {"id": mid, "action": "fetch" if reason in FETCH_REASONS else "skip", "reason": reason}
+        if mid in plan["details"]:
+            item["detail"] = plan["details"][mid]
+        items.append(item)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"appid": str(appid), "created": int(time.time()), "counts": plan["counts"],
+                   "pending": len(plan["pending"]), "items": items}, f, indent=1)
+    os.replace(tmp, path)
+
+def acf_path_for_app(appid: str, workshop_dir: str | None = None) -> str:
+    return os.path.join(workshop_dir or WORKSHOP_DIR, f"appworkshop_{appid}.acf")
+
+# KeyValues (VDF) reader/writer for appworkshop ACFs.
+RX_VDF_TOKEN = re.compile(r'"([^"\\]*(?:\\[\s\S][^"\\]*)*)("?)|([{}])|(//)[^\n]*')
+VDF_CHUNK = 1 << 20
+
+def _vdf_chunks(src):
+    """Split text or an open text file into pieces that end at a line break."""
+    if isinstance(src, str):
+        yield src
+        return
+    rest = ""
+    while True:
+        block = src.read(VDF_CHUNK)
+        if not block:
+            break
+        block = rest + block
+        cut = block.rfind("\n") + 1
+        if cut:
+            yield block[:cut]
+            rest = block[cut:]
+        else:
+            rest = block
+    if rest:
+        yield rest
+
+def parse_vdf(src) -> dict:
+    """
+    Parse KeyValues into nested dicts (file order kept; escapes left as-is).
+    `src` is text or an open text file, which is read in VDF_CHUNK pieces.
+    """
+    root = {}
+    stack = [root]
+    node = root
+    key = None
+    carry = ""
+    for chunk in _vdf_chunks(src):
+        tokens = RX_VDF_TOKEN.findall(carry + chunk)
+        carry = ""
+        if tokens and not (tokens[-1][1] or tokens[-1][2] or tokens[-1][3]):
+            carry = '"' + tokens.pop()[0]  # quoted string continues in the next piece
+        for tok, closed, brace, _comment in tokens:
+            if closed:
+                if key is None:
+                    key = tok
+                else:
+                    node[key] = tok
+                    key = None
+            elif brace == "{":
+                child = {}
+                node[key if key is not None else ""] = child
+                stack.append(child)
+                node = child
+                key = None
+            elif brace == "}":
+                if len(stack) > 1:
+                    stack.pop()
+                    node = stack[-1]
+                key = None
+    return root
+
+def dump_vdf(data: dict, depth: int = 0) -> str:
+    pad = "\t" * depth
+    out = []
+    for k, v in data.items():
+        if isinstance(v, dict):
+            out.append(f'{pad}"{k}"\n{pad}{{\n{dump_vdf(v, depth + 1)}{pad}}}\n')
+        else:
+            out.append(f'{pad}"{k}"\t\t"{v}"\n')
+    return "".join(out)
+
+def read_acf(path: str) -> dict:
+    if not os.path.isfile(path):
+        return {}
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        return parse_vdf(f)
+
+def write_acf(path: str, data: dict):
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"  # unique per writer; os.replace keeps the swap atomic
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(dump_vdf(data))
+    os.replace(tmp, path)
+
+def _int(v) -> int:
+    try:
+        return int(v)
+    except (TypeError, ValueError):
+        return 0
+
+_acf_cache = {}  # path -> ((mtime_ns, size, inode), records)
+_acf_cache_lock = threading.Lock()
+
+def installed_items(appid: str, workshop_dir: str | None = None) -> dict[str, dict]:
+    """
+    { id: {"size", "timeupdated", "manifest", "timetouched"} } for every item in the ACF's
+    WorkshopItemsInstalled section, with timetouched (and anything missing) filled in from
+    WorkshopItemDetails. Parsed once per file version (mtime/size/inode); the returned
+    dict is shared, so don't modify it.
     """
-    if not ids:
+    path = acf_path_for_app(appid, workshop_dir)
+    try:
+        st = os.stat(path)
+    except OSError:
         return {}
-    url = "https://api.steampowered.com/ISteamRemoteStorage/GetPublishedFileDetails/v1/"
-    out = {}
-    BATCH = 100
-    for i in range(0, len(ids), BATCH):
-        chunk = ids[i:i+BATCH]
-        data = {"itemcount": len(chunk)}
-        for idx, mid in enumerate(chunk):
-            data[f"publishedfileids[{idx}]"] = mid
+    stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+    with _acf_cache_lock:
+        hit = _acf_cache.get(path)
+        if hit and hit[0] == stamp:
+            return hit[1]
+    acf = read_acf(path).get("AppWorkshop", {})
+    installed = acf.get("WorkshopItemsInstalled", {})
+    details = acf.get("WorkshopItemDetails", {})
+    records = {}
+    for mid, inst in installed.items():
+        if not mid.isdigit() or not isinstance(inst, dict):
+            continue
+        det = details.get(mid) if isinstance(details.get(mid), dict) else {}
+        records[mid] = {
+            "size": _int(inst.get("size")),
+            "timeupdated": _int(inst.get("timeupdated") or det.get("timeupdated")),
+            "manifest": inst.get("manifest") or det.get("manifest") or "",
+            "timetouched": _int(det.get("timetouched")),
+        }
+    with _acf_cache_lock:
+        _acf_cache[path] = (stamp, records)
+    return records
+
+def write_runscript(path: str, appid: str, ids: list[str]):
+    with open(path, "w", encoding="utf-8") as f:
+        for modid in ids:
+            f.write(f"workshop_download_item {appid} {modid}\n")
+        f.write("quit\n")
+    return path
+
+def steamcmd_command(username: str, password: str, runscript: str, install_dir: str | None = None) -> list[str]:
+    cmd = [steamcmd_exe]
+    if install_dir:
+        cmd += ["+force_install_dir", install_dir]  # must come before +login
+    return cmd + ["+login", username, password, "+runscript", runscript]
+
+RX_ITEM_START = re.compile(r'Downloading item (\d+)')
+RX_ITEM_OK = re.compile(r'Success\. Downloaded item (\d+) to "([^"]*)" \((\d+) bytes\)')
+RX_ITEM_FAIL = re.compile(r'ERROR! Download item (\d+) failed \(([^)]*)\)')
+
+def _fmt_bytes(n: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024:
+            return f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TB"
+
+class DownloadTracker:
+    """Live per-item state parsed from SteamCMD output (shared by all workers)."""
+
+    def __init__(self, total: int = 0):
+        self.total = total
+        self.started = time.time()
+        self.completed = {}   # id -> bytes
+        self.failed = {}      # id -> reason as printed by SteamCMD
+        self.in_flight = set()
+        self.lock = threading.Lock()
+
+    def feed(self, line: str) -> str | None:
+        """Update state from one output line. Returns "ok"/"fail"/"start" if the line was an item event."""
+        m = RX_ITEM_OK.search(line)
+        if m:
+            with self.lock:
+                mid = m.group(1)
+                self.in_flight.discard(mid)
+                self.failed.pop(mid, None)
+                self.completed[mid] = int(m.group(3))
+            return "ok"
+        m = RX_ITEM_FAIL.search(line)
+        if m:
+            with self.lock:
+                mid = m.group(1)
+                self.in_flight.discard(mid)
+                self.failed[mid] = m.group(2).strip()
+            return "fail"
+        m = RX_ITEM_START.search(line)
+        if m:
+            with self.lock:
+                self.in_flight.add(m.group(1))
+            return "start"
+        return None
+
+    def status_line(self) -> str:
+        with self.lock:
+            done, bad, busy = len(self.completed), len(self.failed), len(self.in_flight)
+            size = sum(self.completed.values())
+        minutes = max(1e-9, (time.time() - self.started) / 60)
+        return (f"[progress] {done + bad}/{self.total or '?'} | ok {done} | failed {bad} | in flight {busy} | "
+                f"{_fmt_bytes(size)} | {done / minutes:.1f} items/min | {_fmt_bytes(size / minutes / 60)}/s")
+
+def run_steamcmd(cmd: list[str], tracker: DownloadTracker, label: str = "", timeout: float = 0) -> int:
+    """
+    Run SteamCMD, echo its output and feed every line to `tracker` as it arrives.
+    With `timeout` (seconds) a run that hasn't exited by then is killed; its unfinished
+    items simply get no result line. Returns the exit code.
+    """
+    started = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                            text=True, encoding="utf-8", errors="replace", bufsize=1)
+    watchdog = None
+    if timeout and timeout > 0:
+        def kill():
+            print(f"{label}[steamcmd] No exit after {timeout:.0f}s — killing this run.")
+            proc.kill()
+        watchdog = threading.Timer(timeout, kill)
+        watchdog.daemon = True
+        watchdog.start()
+    try:
+        for line in proc.stdout:
+            line = line.rstrip()
+            if not line:
+                continue
+            print(f"{label}{line}")
+            if tracker.feed(line) in ("ok", "fail"):
+                print(tracker.status_line())
+        return proc.wait()
+    finally:
+        if watchdog:
+            watchdog.cancel()
+        run_metrics.count("steamcmd_runs")
+        run_metrics.count("steamcmd_seconds", time.perf_counter() - started)
+
+# SteamCMD failure text (lower-cased substring) -> retryable | permanent | fatal
+FAILURE_CLASSES = (
+    ("disk write", "fatal"),         # "Disk write failure"
+    ("disk full", "fatal"),
+    ("disk space", "fatal"),
+    ("not enough space", "fatal"),
+    ("access denied", "permanent"),  # not owned / not visible to this account
+    ("not found", "permanent"),      # "File Not Found": item deleted
+    ("invalid", "permanent"),
+    ("timeout", "retryable"),
+)
+
+def classify_failure(reason: str) -> str:
+    r = (reason or "").lower()
+    for needle, kind in FAILURE_CLASSES:
+        if needle in r:
+            return kind
+    return "retryable"  # generic "Failure", connection drops, no result line, empty folder
+
+def verify_downloads(appid: str, ids: list[str], tracker: DownloadTracker) -> dict[str, str]:
+    """
+    Check a finished run. SteamCMD already told us which items failed; only the ones it
+    reported as downloaded are checked against the ACF and disk. Returns { id: reason }.
+    """
+    installed_after_ids = set(get_installed_map(appid).keys())
+    index = disk_index(appid, refresh=[mid for mid in ids if mid in tracker.completed])
+    failed = {}
+    for mid in ids:
+        if mid in tracker.failed:
+            failed[mid] = tracker.failed[mid]
+        elif mid not in tracker.completed:
+            # never reported (SteamCMD crashed, was killed or quit early)
+            failed[mid] = tracker.failed[mid] = "no result from SteamCMD"
+        elif not (mid in installed_after_ids and has_content(index, mid)):
+            failed[mid] = tracker.failed[mid] = "empty or missing after download"
+    if CONFIG.get("integrity_check", False):
+        ok = [mid for mid in ids if mid not in failed]
+        for mid, reason in integrity_check(appid, ok).items():
+            failed[mid] = tracker.failed[mid] = reason
+    ok = [mid for mid in ids if mid not in failed]
+    run_metrics.count("items_downloaded", len(ok))
+    run_metrics.count("bytes_downloaded", sum(tracker.completed.get(mid, 0) for mid in ok))
+    run_metrics.count("download_failures", len(failed))
+    return failed
+
+def run_chunk(appid: str, ids: list[str], username: str, password: str, tracker: DownloadTracker,
+              sizes: dict[str, int] | None = None):
+    """One SteamCMD pass over `ids` (sharded when CONFIG["workers"] > 1)."""
+    workers = max(1, int(CONFIG.get("workers", 1) or 1))
+    for mid in ids:
+        tracker.completed.pop(mid, None)
+        tracker.failed.pop(mid, None)
+    if workers > 1 and len(ids) > 1:
+        run_sharded(appid, ids, username, password, workers, tracker, sizes)
+    else:
+        runscript_path = write_runscript(os.path.join(RUN_DIR, "steamcmd_run.txt"), appid, ids)
+        run_steamcmd(steamcmd_command(username, password, runscript_path), tracker,
+                     timeout=CONFIG.get("chunk_timeout", 0))
+
+def download_with_retries(appid: str, ids: list[str], username: str, password: str,
+                          tracker: DownloadTracker, sizes: dict[str, int] | None = None
+                          ) -> tuple[dict[str, str], dict[str, str]]:
+    """
+    Download `ids` in runscripts of CONFIG["chunk_size"] items. After each round, failures are
+    classified: retryable ones go into the next round (after an exponential backoff),
+    permanent ones are set aside, and a fatal one (disk full) stops everything.
+    Returns (failed, permanent) as { id: reason }.
+    """
+    size = int(CONFIG.get("chunk_size", 0) or 0) or max(1, len(ids))
+    max_retries = int(CONFIG.get("max_retries", 0) or 0)
+    backoff = float(CONFIG.get("retry_backoff", 30) or 0)
+    queue = list(ids)
+    failed, permanent = {}, {}
+    for attempt in range(max_retries + 1):
+        if not queue:
+            break
+        if attempt:
+            wait = backoff * 2 ** (attempt - 1)
+            print(f"\n[retry] Round {attempt}/{max_retries}: {len(queue)} items in {wait:.0f}s...")
+            time.sleep(wait)
+        failed = {}
+        fatal = None
+        chunks = [queue[i:i + size] for i in range(0, len(queue), size)]
+        for n, chunk in enumerate(chunks, 1):
+            if fatal:
+                failed.update({mid: f"not attempted ({fatal})" for mid in chunk})
+                continue
+            if len(chunks) > 1:
+                print(f"\n[chunk {n}/{len(chunks)}] {len(chunk)} items")
+            run_chunk(appid, chunk, username, password, tracker, sizes)
+            for mid, reason in verify_downloads(appid, chunk, tracker).items():
+                kind = classify_failure(reason)
+                if kind == "permanent":
+                    permanent[mid] = reason
+                else:
+                    failed[mid] = reason
+                    if kind == "fatal" and not fatal:
+                        fatal = reason
+        if fatal:
+            print(f"[retry] Fatal failure ({fatal}) — not retrying. Free up space and rerun.")
+            break
+        queue = list(failed)
+    return failed, permanent
+
+_merge_lock = threading.Lock()  # merge_shard read-modify-writes the one canonical ACF
+
+def merge_shard(appid: str, shard_dir: str, ids: list[str], completed) -> int:
+    """
+    Move a shard's downloaded mod folders into the canonical content/<appid> tree and copy
+    their WorkshopItemsInstalled/WorkshopItemDetails entries into the canonical ACF.
+    Only ids in `completed` (those SteamCMD reported as downloaded, e.g. tracker.completed)
+    are moved, so a failed or killed item's partial folder never replaces a working install.
+    Returns the number of mods moved. The shard folder, with anything left in it, is removed afterwards.
+    Merges are serialised, so shards finishing together can't drop each other's ACF entries.
+    """
+    ids = [mid for mid in ids if mid in completed]
+    with _merge_lock:
+        return _merge_shard(appid, shard_dir, ids)
+
+def _merge_shard(appid: str, shard_dir: str, ids: list[str]) -> int:
+    shard_ws = os.path.join(shard_dir, "steamapps", "workshop")
+    src_content = os.path.join(shard_ws, "content", str(appid))
+    dst_content = content_dir_for_app(appid)
+    os.makedirs(dst_content, exist_ok=True)
+    moved = []
+    for mid in ids:
+        src = os.path.join(src_content, mid)
+        if not os.path.isdir(src):
+            continue
+        dst = os.path.join(dst_content, mid)
+        if os.path.exists(dst):
+            shutil.rmtree(dst)
+        shutil.move(src, dst)
+        moved.append(mid)
+
+    src_acf = read_acf(acf_path_for_app(appid, shard_ws)).get("AppWorkshop", {})
+    if moved and src_acf:
+        dst_path = acf_path_for_app(appid)
+        dst = read_acf(dst_path)
+        dst_ws = dst.setdefault("AppWorkshop", {})
+        if not dst_ws:  # first install: start from the shard's header fields
+            dst_ws.update({k: v for k, v in src_acf.items() if not isinstance(v, dict)})
+        for section in ("WorkshopItemsInstalled", "WorkshopItemDetails"):
+            src_sec = src_acf.get(section, {})
+            dst_sec = dst_ws.setdefault(section, {})
+            for mid in moved:
+                if mid in src_sec:
+                    dst_sec[mid] = src_sec[mid]
+        installed = dst_ws.get("WorkshopItemsInstalled", {})
+        dst_ws["SizeOnDisk"] = str(sum(int(v.get("size", "0") or 0) for v in installed.values() if isinstance(v, dict)))
+        write_acf(dst_path, dst)
+
+    shutil.rmtree(shard_dir, ignore_errors=True)
+    return len(moved)
+
+def split_shards(ids: list[str], workers: int, sizes: dict[str, int] | None = None) -> list[list[str]]:
+    """
+    Round-robin split, or with CONFIG["schedule"] == "largest" and known sizes, greedy
+    largest-first bin-packing: each item goes to the shard with the fewest bytes so far.
+    """
+    if CONFIG.get("schedule") == "largest" and sizes:
+        heap = [(0, n) for n in range(workers)]
+        shards = [[] for _ in range(workers)]
+        for mid in sorted(ids, key=lambda m: -sizes.get(m, 0)):
+            load, n = heapq.heappop(heap)
+            shards[n].append(mid)
+            heapq.heappush(heap, (load + sizes.get(mid, 0), n))
+    else:
+        shards = [ids[i::workers] for i in range(workers)]
+    return [s for s in shards if s]
+
+def run_sharded(appid: str, ids: list[str], username: str, password: str, workers: int,
+                tracker: DownloadTracker, sizes: dict[str, int] | None = None):
+    """
+    Split `ids` into `workers` shards (see split_shards) and run one SteamCMD per shard, each with
+    its own runscript and +force_install_dir, then merge every shard into the canonical tree.
+    All workers report into the same `tracker`.
+    """
+    shards = split_shards(ids, workers, sizes)
+    results = {}
+
+    def worker(n, shard):
+        shard_dir = os.path.join(RUN_DIR, f"shard_{n}")
+        runscript = write_runscript(os.path.join(RUN_DIR, f"steamcmd_run_{n}.txt"), appid, shard)
+        print(f"[shard {n}] {len(shard)} items → {shard_dir}")
+        code = run_steamcmd(steamcmd_command(username, password, runscript, shard_dir), tracker, f"[shard {n}] ",
+                            timeout=CONFIG.get("chunk_timeout", 0))
+        moved = merge_shard(appid, shard_dir, shard, tracker.completed)
+        results[n] = (code, moved, len(shard))
+
+    threads = [threading.Thread(target=worker, args=(n, shard)) for n, shard in enumerate(shards, 1)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for n in sorted(results):
+        code, moved, total = results[n]
+        print(f"[shard {n}] SteamCMD exited ({code}); merged {moved}/{total} mods.")
+
+def schedule_ids(ids: list[str], sizes: dict[str, int], policy: str) -> list[str]:
+    """Order pending ids by CONFIG["schedule"]; unknown sizes count as 0 and ties keep listing order."""
+    if policy == "smallest":
+        return sorted(ids, key=lambda m: sizes.get(m, 0))
+    if policy == "largest":
+        return sorted(ids, key=lambda m: -sizes.get(m, 0))
+    return list(ids)
+
+def disk_preflight(ids: list[str], sizes: dict[str, int]) -> bool:
+    """
+    Compare the batch's Workshop file_size total (plus CONFIG["disk_reserve_gb"]) with free
+    space on the steamapps volume. Returns False only when CONFIG["disk_policy"] is "refuse"
+    and the batch doesn't fit.
+    """
+    policy = CONFIG.get("disk_policy", "warn")
+    if policy == "off" or not ids:
+        return True
+    path = WORKSHOP_DIR
+    while not os.path.isdir(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    free = shutil.disk_usage(path).free
+    need = sum(sizes.get(mid, 0) for mid in ids)
+    unknown = sum(1 for mid in ids if not sizes.get(mid))
+    reserve = int(float(CONFIG.get("disk_reserve_gb", 0) or 0) * 1024 ** 3)
+    note = f" ({unknown} items of unknown size)" if unknown else ""
+    print(f"[disk] Batch needs ~{_fmt_bytes(need)}{note}; {_fmt_bytes(free)} free on the steamapps volume.")
+    if need + reserve <= free:
+        return True
+    if policy == "refuse":
+        print(f"❌ Not enough disk space (keeping {_fmt_bytes(reserve)} in reserve). Free up space or shrink the list.")
+        return False
+    print(f"⚠️ The batch may not fit (keeping {_fmt_bytes(reserve)} in reserve) — continuing anyway.")
+    return True
+
+RX_LOGIN_OK = re.compile(r"Logging in user .*\.\.\.OK|Logged in OK|Waiting for user info\.\.\.OK")
+RX_LOGIN_FAIL = re.compile(r"Logging in user .*\.\.\.FAILED|FAILED login|Login Failure")
+
+class SteamCmdSession:
+    """
+    One long-lived, logged-in SteamCMD that takes commands on a stdin pipe, so repeated
+    downloads skip the cold start and +login. A reader thread feeds its output to the
+    tracker of the current download() call.
+    """
+
+    def __init__(self, username: str, password: str, label: str = "[session] "):
+        self.label = label
+        self.tracker = DownloadTracker()
+        self.cond = threading.Condition()
+        self.logged_in = None  # None until SteamCMD answers the login
+        self.proc = subprocess.Popen([steamcmd_exe, "+login", username, password],
+                                     stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                     text=True, encoding="utf-8", errors="replace", bufsize=1)
+        self.reader = threading.Thread(target=self._read, daemon=True)
+        self.reader.start()
+
+    def _read(self):
+        for line in self.proc.stdout:
+            line = line.rstrip()
+            if not line:
+                continue
+            print(f"{self.label}{line}")
+            with self.cond:
+                if self.logged_in is None:
+                    if RX_LOGIN_OK.search(line):
+                        self.logged_in = True
+                    elif RX_LOGIN_FAIL.search(line):
+                        self.logged_in = False
+                event = self.tracker.feed(line)
+                self.cond.notify_all()
+            if event in ("ok", "fail"):
+                print(self.tracker.status_line())
+        with self.cond:
+            self.cond.notify_all()
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def wait_login(self, timeout: float) -> bool:
+        with self.cond:
+            self.cond.wait_for(lambda: self.logged_in is not None or not self.alive(), timeout)
+            return bool(self.logged_in)
+
+    def send(self, command: str) -> bool:
         try:
-            r = requests.post(url, data=data, timeout=25)
-            r.raise_for_status()
-            j = r.json()
-            for item in j.get("response", {}).get("publishedfiledetails", []):
-                mid = str(item.get("publishedfileid", ""))
-                tu = int(item.get("time_updated", 0) or 0)
-                if mid:
-                    out[mid] = tu
-        except Exception as e:
-            print(f"[warn] time_updated fetch failed for {len(chunk)} ids: {e}")
-        time.sleep(0.25)
-    return out
+            self.proc.stdin.write(command + "\n")
+            self.proc.stdin.flush()
+            return True
+        except (OSError, ValueError):
+            return False
+
+    def download(self, appid: str, ids: list[str], timeout: float = 0) -> DownloadTracker:
+        """
+        Queue workshop_download_item for every id and wait until each has a result line
+        (or SteamCMD dies, or `timeout` seconds pass). Returns this batch's tracker.
+        """
+        started = time.perf_counter()
+        with self.cond:
+            self.tracker = tracker = DownloadTracker(len(ids))
+        for mid in ids:
+            if not self.send(f"workshop_download_item {appid} {mid}"):
+                break
+        with self.cond:
+            self.cond.wait_for(lambda: len(tracker.completed) + len(tracker.failed) >= len(ids) or not self.alive(),
+                               timeout if timeout and timeout > 0 else None)
+        run_metrics.count("steamcmd_runs")
+        run_metrics.count("steamcmd_seconds", time.perf_counter() - started)
+        return tracker
+
+    def close(self):
+        if self.alive():
+            self.send("quit")
+            try:
+                self.proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+        self.reader.join(timeout=5)
+
+def start_session(username: str, password: str) -> SteamCmdSession | None:
+    session = SteamCmdSession(username, password)
+    if session.wait_login(CONFIG.get("login_timeout", 120)):
+        print("[session] SteamCMD logged in; keeping it open.")
+        return session
+    print("❌ SteamCMD login failed or timed out (if Steam Guard asks for a code, run once without watch mode first).")
+    session.close()
+    return None
+
+def watch(appid: str, ids_file: str, folder: str, username: str, password: str):
+    """
+    Watch mode: keep one SteamCMD logged in and, every CONFIG["watch_interval"] seconds,
+    re-read `ids_file`, poll time_updated and download only new or changed items.
+    Permanent failures are dropped from later rounds; Ctrl+C stops.
+    """
+    interval = max(30.0, float(CONFIG.get("watch_interval", 600) or 600))
+    session = start_session(username, password)
+    if not session:
+        return
+    permanent = {}
+    first = True
+    try:
+        while True:
+            if not session.alive():
+                print("[session] SteamCMD exited — logging in again.")
+                session = start_session(username, password)
+                if not session:
+                    return
+            listed = read_ids(ids_file)
+            ids = [mid for mid in listed if mid not in permanent]
+            with run_metrics.phase("poll", items=len(ids)):
+                installed = get_installed_map(appid)
+                check_disk = first and CONFIG.get("require_nonempty_on_disk", True)
+                index = disk_index(appid) if check_disk else {}
+                # short TTL so each poll sees fresh update times; ids the API can't answer wait for the next poll
+                rows = get_details([mid for mid in ids if mid in installed], ttl=min(CONFIG.get("meta_ttl", 0), interval / 2))
+                todo = [mid for mid in ids
+                        if mid not in installed
+                        or (mid in rows and rows[mid]["time_updated"] > installed[mid])
+                        or (check_disk and not has_content(index, mid))]
+            first = False
+            stamp = time.strftime("%H:%M:%S")
+            if not todo:
+                print(f"[watch {stamp}] {len(ids)} tracked, all up to date. Next check in {interval:.0f}s.")
+            else:
+                print(f"\n[watch {stamp}] {len(todo)} new/updated of {len(ids)} tracked.")
+                with run_metrics.phase("download", items=len(todo)):
+                    tracker = session.download(appid, todo, CONFIG.get("chunk_timeout", 0))
+                    failed = verify_downloads(appid, todo, tracker)
+                for mid, reason in failed.items():
+                    kind = classify_failure(reason)
+                    if kind == "fatal":
+                        print(f"❌ {reason} — stopping watch mode. Free up space and restart.")
+                        return
+                    if kind == "permanent":
+                        permanent[mid] = reason
+                if any(r == "no result from SteamCMD" for r in failed.values()):
+                    print("[session] SteamCMD stopped answering — restarting it.")
+                    session.close()
+                    session = start_session(username, password)
+                    if not session:
+                        return
+                if failed:
+                    print(f"[watch] {len(failed)} failed ({sum(1 for m in failed if m in permanent)} permanent); "
+                          f"the rest will be retried next round.")
+                if permanent:
+                    with open(os.path.join(folder, "permanent_failed_ids.txt"), "w", encoding="utf-8") as f:
+                        f.write("\n".join(f"{mid}\t{reason}" for mid, reason in permanent.items()))
+                if CONFIG.get("dedupe", False):
+                    dedupe_content(appid)
+                if CONFIG.get("sync_targets"):
+                    sync_targets(appid, [mid for mid in todo if mid not in failed], listed)
+            save_metrics(quiet=True)  # refresh the .prom file every round
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("\n[watch] Stopping.")
+    finally:
+        if session:
+            session.close()
+
+def save_metrics(quiet: bool = False):
+    """Save the run report (see CONFIG["metrics"]); unless `quiet`, print the phase summary first."""
+    m = run_metrics.current
+    if not m.phases or not CONFIG.get("metrics", True):
+        return
+    if not quiet:
+        print("\n" + m.summary_line())
+    path = m.write(prom_dir=CONFIG.get("metrics_prom_dir") or None)
+    if path and not quiet:
+        print(f"[metrics] Report saved to {path}")
 
 def _choose_folder():
     folders = _find_modlink_folders()
@@ -174,6 +1316,8 @@ def ask_appid(folder):
 
 if __name__ == "__main__":
     print("=== Simple SteamCMD Mod Downloader ===")
+    run_metrics.start("downloader", CONFIG.get("profile", ""), CONFIG.get("profile_memory", False))
+    atexit.register(save_metrics)
 
     steam_username = input("Steam username: ").strip()
     if not steam_username:
@@ -188,100 +1332,89 @@ if __name__ == "__main__":
         raise SystemExit(1)
 
     appid = ask_appid(chosen_folder)
+    run_metrics.current.folder = os.path.join(chosen_folder, "reports")
+
+    if CONFIG.get("watch"):
+        watch(appid, ids_file, chosen_folder, steam_username, steam_password)
+        raise SystemExit(0)
 
     ids = read_ids(ids_file)
     print(f"\nLoaded {len(ids)} IDs.\n")
 
     # Filter out installed & up-to-date mods; force re-download for empty folders
-    if CONFIG.get("skip_already_downloaded", True):
-        installed_map = get_installed_map(appid)  # {id: timeupdated_int}
-        if installed_map:
-            installed_ids = set(installed_map.keys())
-
-            # 4a) If required, drop “installed” items whose on-disk folders are empty
-            if CONFIG.get("require_nonempty_on_disk", True):
-                actually_present = set()
-                empty_or_missing = set()
-                for mid in installed_ids:
-                    if folder_has_content(mod_folder_path(appid, mid)):
-                        actually_present.add(mid)
-                    else:
-                        empty_or_missing.add(mid)
-                if empty_or_missing:
-                    print(f"[disk] {len(empty_or_missing)} installed ids have empty/missing folders → will re-download those.")
-            else:
-                actually_present = installed_ids
-                empty_or_missing = set()
-
-            # Base new set: anything not in actually_present is brand-new
-            new_ids = [i for i in ids if i not in actually_present]
-
-            # 4b) Update check: include installed-but-outdated
-            if CONFIG.get("check_updates", True):
-                to_check = [i for i in ids if i in actually_present]
-                remote_map = fetch_remote_timeupdated(to_check)
-                need_update = []
-                up_to_date = 0
-                for mid in to_check:
-                    local_t = installed_map.get(mid, 0)
-                    remote_t = remote_map.get(mid, 0)
-                    if remote_t > local_t:
-                        need_update.append(mid)
-                    else:
-                        up_to_date += 1
-                # force re-download for empty/missing even if up-to-date
-                need_redownload = list(empty_or_missing)
-                pending = new_ids + need_update + need_redownload
-                # De-duplicate while preserving order from original ids
-                seen = set()
-                pending = [x for x in ids if x in set(pending) and (x not in seen and not seen.add(x))]
-                print(f"[acf] Installed: {len(installed_ids)} | Up-to-date: {up_to_date} | Need update: {len(need_update)} | "
-                    f"Empty/missing: {len(empty_or_missing)} | New: {len(new_ids)}")
-                print(f"[acf] Will fetch {len(pending)} items.")
-                ids = pending
-            else:
-                # No update check: fetch newly missing + empty/missing
-                base = new_ids + list(empty_or_missing)
-                seen = set()
-                pending = [x for x in ids if x in set(base) and (x not in seen and not seen.add(x))]
-                skipped = len(ids) - len(pending)
-                print(f"[acf] Skipping {skipped} already downloaded mods (including empty/missing requeue). {len(pending)} left to fetch.")
-                ids = pending
-        else:
-            print("[acf] No ACF file or no installed mods found — proceeding with all IDs.")
-
+    with run_metrics.phase("plan", items=len(ids)):
+        plan = plan_downloads(appid, ids)
+    counts = plan["counts"]
+    if counts.get("empty"):
+        print(f"[disk] {counts['empty']} installed ids have empty/missing folders → will re-download those.")
+    for mid, reason in plan["details"].items():
+        print(f"[integrity] {mid}: {reason}")
+    if counts.get("unknown"):
+        print(f"[acf] {counts['unknown']} installed ids have no remote time_updated (API failed, or hidden/removed) → skipped; "
+              "they're checked again next run (see download_plan.json).")
+    print(f"[acf] New: {counts.get('new', 0)} | Up-to-date: {counts.get('up_to_date', 0) + counts.get('installed', 0)} | "
+          f"Need update: {counts.get('outdated', 0)} | Unknown: {counts.get('unknown', 0)} | "
+          f"Empty/missing: {counts.get('empty', 0)} | Integrity: {counts.get('integrity', 0)}")
+    print(f"[acf] Will fetch {len(plan['pending'])} items.")
+    run_metrics.gauge("items_listed", len(plan["ids"]))
+    run_metrics.gauge("items_pending", len(plan["pending"]))
+    plan_path = os.path.join(chosen_folder, "download_plan.json")
+    write_plan(plan_path, appid, plan)
+    print(f"[plan] Saved to {plan_path}")
+    if CONFIG.get("dry_run", False):
+        print("\nDry run — nothing downloaded.")
+        raise SystemExit(0)
+    ids = plan["pending"]
 
-    # Write a runscript next to the IDs file
-    runscript_path = os.path.join(RUN_DIR, "steamcmd_run.txt")
-    with open(runscript_path, "w", encoding="utf-8") as f:
-        for modid in ids:
-            f.write(f"workshop_download_item {appid} {modid}\n")
-        f.write("quit\n")
-
-    # Call steamcmd once, pointing to the runscript
-    cmd = [steamcmd_exe, "+login", steam_username, steam_password, "+runscript", runscript_path]
+    # Size-aware ordering and free-space check (file_size comes from the metadata cache)
+    sizes = {}
+    policy = CONFIG.get("schedule", "listing")
+    if ids and (policy != "listing" or CONFIG.get("disk_policy", "warn") != "off"):
+        sizes = {mid: row["file_size"] for mid, row in get_details(ids, ttl=CONFIG.get("meta_ttl", 0)).items()}
+        ids = schedule_ids(ids, sizes, policy)
+        if not disk_preflight(ids, sizes):
+            raise SystemExit(1)
 
+    tracker = DownloadTracker(len(ids))
     print("\nRunning SteamCMD...\n")
-    subprocess.run(cmd)
+    with run_metrics.phase("download", items=len(ids)):
+        failed_map, permanent = download_with_retries(appid, ids, steam_username, steam_password, tracker, sizes)
+    print(tracker.status_line())
+    failed = [mid for mid in ids if mid in failed_map]
+    run_metrics.gauge("items_failed", len(failed))
+    run_metrics.gauge("items_permanent_failed", len(permanent))
 
-    # After SteamCMD completes, check ACF presence and on-disk content
-    installed_after_map = get_installed_map(appid)
-    installed_after_ids = set(installed_after_map.keys())
-    failed = []
-    for mid in ids:
-        folder_ok = folder_has_content(mod_folder_path(appid, mid))
-        in_acf = (mid in installed_after_ids)
-        if not (folder_ok and in_acf):
-            failed.append(mid)
+    if failed_map or permanent:
+        reasons = {}
+        for reason in list(failed_map.values()) + list(permanent.values()):
+            reasons[reason] = reasons.get(reason, 0) + 1
+        print("[steamcmd] Failures: " + ", ".join(f"{r} ×{n}" for r, n in sorted(reasons.items(), key=lambda x: -x[1])))
+
+    if permanent:
+        perm_path = os.path.join(chosen_folder, "permanent_failed_ids.txt")
+        with open(perm_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(f"{mid}\t{permanent[mid]}" for mid in ids if mid in permanent))
+        print(f"\n⛔ {len(permanent)} mods can't be downloaded (deleted/private/no access). Saved to {perm_path}")
 
+    fail_path = os.path.join(chosen_folder, "failed_ids.txt")
     if failed:
         print(f"\n⚠️ {len(failed)} mods failed or are empty. Writing to failed_ids.txt...")
-        fail_path = os.path.join(chosen_folder, "failed_ids.txt")
         with open(fail_path, "w", encoding="utf-8") as f:
             f.write("\n".join(failed))
         print(f"  • Saved list to {fail_path}")
-    else:
+    elif os.path.exists(fail_path):
+        os.remove(fail_path)  # left by an earlier run; nothing in it is still failing
+        print(f"\n[steamcmd] Nothing left to retry — removed the old {fail_path}")
+    if not failed_map and not permanent:
         print("\n✅ All mods appear to have downloaded correctly and contain files!")
 
+    if CONFIG.get("dedupe", False):
+        with run_metrics.phase("dedupe"):
+            dedupe_content(appid)
+
+    if CONFIG.get("sync_targets"):
+        bad = set(failed) | set(permanent)
+        with run_metrics.phase("sync"):
+            sync_targets(appid, [mid for mid in ids if mid not in bad], plan["ids"])
 
 
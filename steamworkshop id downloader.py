@@ -1,9 +1,14 @@
-import os, re, json, time, requests, shutil
+import os, re, json, math, requests, shutil
 from datetime import datetime
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
 from http.cookiejar import MozillaCookieJar
 from requests.cookies import create_cookie
+from workshop_meta import api_session, get_details, store_details
+from steam_http import HttpCache, mount_cached, mount_limited, set_start_rate, current_rate
+from run_history import history_path, append_run, read_titles_file
+import run_metrics
 
 
 def ensure_dir(path):
@@ -13,19 +18,44 @@ def ensure_dir(path):
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 OUTPUT_ROOT = os.path.join(SCRIPT_DIR, "0 - output")
 ensure_dir(OUTPUT_ROOT)
+HTTP_CACHE_DIR = os.path.join(OUTPUT_ROOT, ".http_cache")
 
 CONFIG = {
     "cookie_path": os.path.join(SCRIPT_DIR, "steam cookie.txt"),
     "use_cookies": True,      # set False to disable cookies entirely
     "base": "modlist",        # output folder name prefix
     "max_pages": 0,          # 0 = unlimited
-    "delay": 0.4              # delay between page requests
+    "delay": 0.4,             # starting delay between page requests (adapts to how Steam responds)
+    "concurrency": 6,         # parallel page fetches once the page count is known (1 = serial)
+    "api_key": "",            # Steam Web API key; enables QueryFiles for browse/search URLs
+    "use_query_files": True,  # enumerate browse/search listings via IPublishedFileService/QueryFiles
+    "meta_ttl": 7 * 86400,    # seconds cached titles in workshop_meta.sqlite3 are reused
+    "http_cache": True,       # reuse pages within a run; revalidate (ETag/Last-Modified) across runs
+    "http_cache_days": 14,    # drop cached pages not used for this many days (0 = keep)
+    "http_cache_mb": 256,     # trim each '.http_cache' folder to this size, least recently used first (0 = no limit)
+    "incremental": False,     # stop once pages only contain IDs from the previous ids.txt (newest-first listings)
+    "incremental_known_pages": 3, # consecutive already-known pages that end an incremental crawl
+    "allow_partial": False,   # let an interrupted crawl overwrite ids.txt (otherwise it only checkpoints)
+    "stop_at_grid_end": True, # stop scanning a listing page once the item grid's pager is reached
+    "history": True,          # log each run as a delta in lists/history.jsonl.gz (see run_history.py)
+    "keep_old_runs": False,   # also move full copies of the previous lists into 'old runs/<date>'
+    "metrics": True,          # save a run report (JSON + Prometheus .prom) in '<game folder>/reports'
+    "metrics_prom_dir": "",   # folder for the .prom file instead (e.g. node_exporter's textfile directory)
+    "profile": "",            # phases to run under cProfile: "setup", "crawl", "titles", "write" (comma-separated) or "all"
+    "profile_memory": False   # also trace allocations (tracemalloc) in the profiled phases
 }
 
 # IO helpers 
 def path_join(*parts):
     return os.path.join(*parts)
 
+def read_id_list(path):
+    """IDs from a previous ids.txt (one per line); empty set if missing."""
+    if not os.path.exists(path):
+        return set()
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        return {line.strip() for line in f if line.strip().isdigit()}
+
 def write_lines(path, lines):
     ensure_dir(os.path.dirname(path))
     with open(path, "w", encoding="utf-8") as f:
@@ -52,7 +82,8 @@ def sanitize_name(s: str) -> str:
 
 def detect_app_name(session, url: str) -> str | None:
     try:
-        r = session.get(url, timeout=20)
+        # same URL as detect_appid/fetch_ids page 1, so a caching session fetches it once
+        r = session.get(set_page_param(url, 1), timeout=20)
         r.raise_for_status()
         html = r.text
     except Exception:
@@ -82,6 +113,43 @@ RX_APPID_ATTR = re.compile(r'data-appid="(\d+)"')
 RX_APPID_ATTR_ESC = re.compile(r'data-appid=\\"(\d+)\\"')
 RX_APPID_SCRIPT = re.compile(r'\b(BrowseAppId|PublishedFileService\.m_appid)\s*[:=]\s*["\']?(\d+)')
 
+# Single-pass scanner over raw page bytes. Every ID/appid pattern above ends its
+# attribute name in "id"/"Id" before the number, so one regex anchored on that "d"
+# (a literal prefix, which re can skip to quickly) finds them all; the bytes just
+# before the match say what the number is.
+RX_SCAN = re.compile(rb'd(\s*[:=]\s*\\?["\']?)(\d+)')
+SCAN_KINDS = (  # (bytes ending at the matched "d", kind, allowed separators or None for any)
+    (b"filedetails/?id", "id", (b"=",)),
+    (b"data-publishedfileid", "id", (b'="', b'=\\"')),
+    (b"data-appid", "app", (b'="', b'=\\"')),
+    (b"?appid", "app", (b"=",)),
+    (b"&appid", "app", (b"=",)),
+    (b"BrowseAppId", "app", None),
+    (b"PublishedFileService.m_appid", "app", None),
+)
+SCAN_CONTEXT = max(len(k) for k, _, _ in SCAN_KINDS)
+RX_PAGER = re.compile(rb'Showing\s+([\d,]+)\s*-\s*([\d,]+)\s+of\s+([\d,]+)\s+entries')
+EMPTY_MARKERS = (b"There are no items", b"No items found", b"This profile is private",
+                 b"You must be logged in to view this content", b"This item is private")
+GRID_END = b'class="workshopBrowsePaging'
+SCAN_TAIL = 256        # bytes kept between chunks so a match split across them is not lost
+SCAN_CHUNK = 64 * 1024
+
+def make_session(pool_size=1, cache_ns=None):
+    """
+    requests.Session with our UA, the shared per-host rate limiter and a pool sized
+    for parallel fetches. With `cache_ns` ("cookie"/"anon"), GETs go through an
+    HttpCache kept under HTTP_CACHE_DIR/<cache_ns>, so the two modes never share pages.
+    """
+    s = requests.Session()
+    s.headers.update(UA)
+    if cache_ns:
+        cache = HttpCache(os.path.join(HTTP_CACHE_DIR, cache_ns),
+                          max_age=float(CONFIG.get("http_cache_days", 14) or 0) * 86400,
+                          max_bytes=int(float(CONFIG.get("http_cache_mb", 256) or 0) * (1 << 20)))
+        return mount_cached(s, cache, pool_size)
+    return mount_limited(s, pool_size)
+
 def _make_old_run_folder(root_dir: str) -> str:
     base = os.path.join(root_dir, "old runs")
     os.makedirs(base, exist_ok=True)
@@ -160,6 +228,8 @@ def load_cookies(session, path):
         return "json"
     raise ValueError("unrecognized cookies format (expected Netscape or JSON)")
 
+# Decoded-text helpers. Crawling uses scan_page() on raw bytes instead; these remain
+# for callers that already hold a str (and as the baseline in benchmarks/bench_extract.py).
 def extract_ids(html):
     ids = set(RX_ID_URL.findall(html))
     ids.update(RX_DATA_ATTR1.findall(html))
@@ -173,43 +243,249 @@ def looks_empty(html):
             return True
     return False
 
-def fetch_ids(session, url, max_pages, delay):
+def scan_page(chunks, stop_at_grid_end=False):
+    """
+    One pass over a page given as an iterable of bytes chunks (no str decoding).
+    Returns {"ids": set, "appids": list (with repeats, for voting), "pager": (first, last, total) | None,
+             "empty": bool, "bytes": int, "stopped": bool}.
+    With stop_at_grid_end, scanning ends at the first pager after an item has been seen
+    (the rest of the page is chrome); remaining chunks are still consumed so a pooled
+    keep-alive connection stays reusable.
+    """
+    out = {"ids": set(), "appids": [], "pager": None, "empty": False, "bytes": 0, "stopped": False}
+    ids, appids = out["ids"], out["appids"]
+    buf = b""
+    start = 0
+    it = iter(chunks)
+    final = False
+    while not final:
+        chunk = next(it, None)
+        if chunk is None:
+            final = True
+        else:
+            out["bytes"] += len(chunk)
+            buf += chunk
+            if len(buf) - start < SCAN_CHUNK:
+                continue
+        limit = len(buf) if final else len(buf) - SCAN_TAIL
+        pos = start
+        cut = limit
+        # the grid ends at the first pager after an item; -1 = not located yet
+        grid_end = buf.find(GRID_END, max(0, start - len(GRID_END))) if stop_at_grid_end and ids else -1
+        for m in RX_SCAN.finditer(buf, start):
+            if 0 <= grid_end < m.start():
+                break
+            if m.end() > limit:
+                cut = min(cut, m.start())  # may be truncated: rescan it with the next chunk
+                break
+            pos = m.end()
+            s = m.start()
+            head = buf[max(0, s - SCAN_CONTEXT + 1):s + 1]
+            for ctx, kind, seps in SCAN_KINDS:
+                if head.endswith(ctx):
+                    if seps is None or m.group(1) in seps:
+                        if kind == "id":
+                            if stop_at_grid_end and not ids:
+                                grid_end = buf.find(GRID_END, m.end())
+                            ids.add(m.group(2).decode())
+                        else:
+                            appids.append(m.group(2).decode())
+                    break
+        out["stopped"] = 0 <= grid_end and grid_end + len(GRID_END) <= limit
+        # rare markers: plain substring searches over the same window
+        if out["pager"] is None:
+            pm = RX_PAGER.search(buf, max(0, start - SCAN_TAIL))
+            if pm:
+                out["pager"] = tuple(int(g.replace(b",", b"")) for g in pm.groups())
+        if not out["empty"]:
+            window = buf[max(0, start - SCAN_TAIL):]
+            out["empty"] = any(mk in window for mk in EMPTY_MARKERS)
+        if out["stopped"]:
+            for chunk in it:
+                out["bytes"] += len(chunk)
+            break
+        keep = max(pos, cut)
+        base = max(0, keep - SCAN_CONTEXT)
+        buf = buf[base:]
+        start = keep - base
+    return out
+
+def page_count(pager):
+    """
+    (per_page, total_pages) from a scanned "Showing 1-30 of N entries" pager, or None.
+    """
+    if not pager:
+        return None
+    first, last, total = pager
+    per_page = last - first + 1
+    if per_page <= 0 or total <= 0:
+        return None
+    return per_page, math.ceil(total / per_page)
+
+def _get_page(session, url, p, stop_at_grid_end=False):
+    """Fetch and scan listing page p. Returns (p, scan, error)."""
+    try:
+        with session.get(set_page_param(url, p), timeout=25, stream=True) as r:
+            r.raise_for_status()
+            scan = scan_page(r.iter_content(SCAN_CHUNK), stop_at_grid_end)
+            if "Content-Length" not in r.headers and not getattr(r, "from_cache", False):
+                run_metrics.count("http_bytes", scan["bytes"])  # chunked pages carry no length
+            return p, scan, None
+    except Exception as e:
+        return p, None, e
+
+CHECKPOINT_EVERY = 10  # pages between checkpoint writes
+
+def load_checkpoint(path, url, cookie_mode):
+    """Checkpoint dict for this URL + cookie mode, or None if absent/for another crawl."""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            cp = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"[warn] Ignoring unreadable checkpoint {path}: {e}")
+        return None
+    if cp.get("url") != url or cp.get("cookie_mode") != cookie_mode:
+        print("[i] Checkpoint is for a different URL or cookie mode — starting fresh.")
+        return None
+    return cp
+
+def save_checkpoint(path, url, cookie_mode, pages, ids):
+    ensure_dir(os.path.dirname(path))
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"url": url, "cookie_mode": cookie_mode,
+                   "updated": datetime.now().isoformat(timespec="seconds"),
+                   "pages": sorted(pages), "ids": sorted(ids)}, f)
+    os.replace(tmp, path)
+
+def fetch_ids(session, url, max_pages, concurrency=1, known=None, known_pages=0, status=None,
+              checkpoint=None, cookie_mode="", on_ids=None):
+    """
+    Crawl listing pages into a set of IDs. Pacing comes from the shared per-host
+    rate limiter mounted on `session` (see steam_http), not fixed sleeps.
+
+    Incremental mode: with `known` (previous run's IDs) and `known_pages` > 0 the crawl
+    stops after that many consecutive pages containing only known IDs.
+    If given, `status` is filled with "stop": exhausted | max_pages | known | error.
+
+    With a `checkpoint` path, completed pages and collected IDs are saved every
+    CHECKPOINT_EVERY pages and when a page fails; a later call for the same URL and
+    `cookie_mode` resumes from there. The checkpoint is removed once a crawl finishes.
+
+    `on_ids`, if given, is called with each batch of newly seen IDs (in page order) while
+    the crawl runs, so a consumer can start on them before it ends.
+    """
     seen = set()
+    done = set()
     empty_streak = 0
-    p = 1
+    known_streak = 0
+    last_count = 0
     unlimited = not max_pages or max_pages <= 0  # True if 0 or None
-
-    while True:
-        page_url = set_page_param(url, p)
-        try:
-            r = session.get(page_url, timeout=25)
-            r.raise_for_status()
-        except Exception as e:
-            print(f"[warn] Page {p} failed: {e}")
-            break
-        html = r.text
-        ids = extract_ids(html)
+    if status is None:
+        status = {}
+    grid_stop = CONFIG.get("stop_at_grid_end", False)
+
+    cp = load_checkpoint(checkpoint, url, cookie_mode)
+    if cp:
+        done.update(cp.get("pages", []))
+        seen.update(cp.get("ids", []))
+        print(f"[i] Resuming from checkpoint: {len(done)} page(s), {len(seen)} IDs.")
+        if on_ids and seen:
+            on_ids(sorted(seen))
+
+    def take(p, scan, err):
+        """Merge one scanned page into `seen`. Returns True when the crawl should stop."""
+        nonlocal empty_streak, known_streak, last_count
+        if err is not None:
+            print(f"[warn] Page {p} failed: {err}")
+            status["stop"] = "error"
+            return True
+        ids = scan["ids"]
+        last_count = len(ids)
+        run_metrics.count("pages")
         new = [i for i in ids if i not in seen]
+        done.add(p)
         if new:
             seen.update(new)
-            print(f"[+] Page {p}: +{len(new)} (total {len(seen)})")
+            print(f"[+] Page {p}: +{len(new)} (total {len(seen)}) @ {current_rate(url):.1f} req/s")
+            if on_ids:
+                on_ids(new)
             empty_streak = 0
         else:
             empty_streak += 1
             print(f"[i] Page {p}: no new items (streak {empty_streak})")
+        if checkpoint and len(done) % CHECKPOINT_EVERY == 0:
+            save_checkpoint(checkpoint, url, cookie_mode, done, seen)
 
-        if looks_empty(html) or empty_streak >= 2:
+        if scan["empty"] or empty_streak >= 2:
             print("[i] Listing exhausted. Stopping.")
-            break
+            status["stop"] = "exhausted"
+            return True
+
+        if known and known_pages > 0:
+            known_streak = known_streak + 1 if ids and ids <= known else 0
+            if known_streak >= known_pages:
+                print(f"[i] {known_streak} consecutive pages of already-known IDs. Stopping (incremental).")
+                status["stop"] = "known"
+                return True
 
         # Stop if we have a finite max_pages and reached it
         if not unlimited and p >= max_pages:
             print(f"[info] Reached configured max_pages ({max_pages}). Stopping.")
-            break
-
-        p += 1
-        time.sleep(delay)
+            status["stop"] = "max_pages"
+            return True
+        return False
 
+    def crawl():
+        scan = None
+        if 1 not in done or concurrency > 1:
+            # page 1 is scanned in full: it carries the pager we count pages from
+            _, scan, err = _get_page(session, url, 1)
+            if 1 not in done:
+                if take(1, scan, err):
+                    return
+        p = 2
+
+        # Concurrent mode: page 1 tells us how many pages there are, fetch the rest in parallel windows.
+        counted = page_count(scan["pager"]) if scan and concurrency > 1 else None
+        if counted:
+            per_page, last = counted
+            if not unlimited:
+                last = min(last, max_pages)
+            print(f"[i] Listing reports {last} page(s) of {per_page} — fetching with {concurrency} workers.")
+            todo = [n for n in range(2, last + 1) if n not in done]
+            with ThreadPoolExecutor(max_workers=concurrency) as ex:
+                for start in range(0, len(todo), concurrency):
+                    window = todo[start:start + concurrency]
+                    # results come back in page order so the empty-streak rule still means "consecutive pages"
+                    for pn, scan, err in ex.map(lambda n: _get_page(session, url, n, grid_stop), window):
+                        if take(pn, scan, err):
+                            return
+            p = last + 1
+            # The listing can grow while we crawl; only keep walking if the last page was full.
+            if last_count < per_page or (not unlimited and p > max_pages):
+                status["stop"] = "exhausted"
+                return
+
+        while True:
+            if p in done:
+                p += 1
+                continue
+            _, scan, err = _get_page(session, url, p, grid_stop)
+            if take(p, scan, err):
+                return
+            p += 1
+
+    crawl()
+
+    if checkpoint:
+        if status.get("stop") == "error":
+            save_checkpoint(checkpoint, url, cookie_mode, done, seen)
+            print(f"[i] Crawl incomplete — progress saved to {checkpoint}; rerun to resume.")
+        elif os.path.exists(checkpoint):
+            os.remove(checkpoint)
     return seen
 
 def detect_appid(url, session):
@@ -217,53 +493,180 @@ def detect_appid(url, session):
     q = parse_qs(parsed.query)
     if "appid" in q and q["appid"][0].isdigit():
         return q["appid"][0]
-    try:
-        r = session.get(set_page_param(url, 1), timeout=25)
-        r.raise_for_status()
-        html = r.text
-    except Exception:
+    _, scan, err = _get_page(session, url, 1)
+    if err is not None:
         return None
-    cands = []
-    cands += RX_APPID_QS.findall(html)
-    cands += RX_APPID_ATTR.findall(html)
-    cands += RX_APPID_ATTR_ESC.findall(html)
-    cands += [m[1] for m in RX_APPID_SCRIPT.findall(html)]
-    nums = [x for x in cands if x.isdigit()]
+    nums = scan["appids"]
     return Counter(nums).most_common(1)[0][0] if nums else None
 
-def fetch_titles_via_api(ids):
+def collection_id_from_url(url: str) -> str | None:
+    """Return the item id of a .../filedetails/?id=<n> URL (collections live there), else None."""
+    u = urlparse(url)
+    if not u.path.rstrip("/").endswith("filedetails"):
+        return None
+    cid = parse_qs(u.query).get("id", [""])[0]
+    return cid if cid.isdigit() else None
+
+def resolve_collection(collection_id: str) -> list[str] | None:
     """
-    Batch-queries Steam's GetPublishedFileDetails API for titles.
-    Returns: dict[str id] -> str title
+    Expand a collection via ISteamRemoteStorage/GetCollectionDetails, following
+    nested sub-collections breadth-first, 100 collections per call.
+    Returns item IDs in collection order (deduped), or None if the id is not a
+    collection or the API could not be read — callers then fall back to HTML.
+    """
+    url = "https://api.steampowered.com/ISteamRemoteStorage/GetCollectionDetails/v1/"
+    items = []
+    seen_items = set()
+    visited = {collection_id}
+    queue = [collection_id]
+    BATCH = 100
+    while queue:
+        batch, queue = queue[:BATCH], queue[BATCH:]
+        payload = {"collectioncount": len(batch)}
+        for j, cid in enumerate(batch):
+            payload[f"publishedfileids[{j}]"] = cid
+        try:
+            r = api_session().post(url, data=payload, timeout=30)
+            r.raise_for_status()
+            details = r.json().get("response", {}).get("collectiondetails", [])
+        except Exception as e:
+            print(f"[warn] GetCollectionDetails failed: {e}")
+            return None
+        by_id = {str(d.get("publishedfileid")): d for d in details}
+        for cid in batch:
+            d = by_id.get(cid, {})
+            if d.get("result") != 1 or "children" not in d:
+                if cid == collection_id:
+                    return None  # not a collection (or private) — let the HTML path handle it
+                print(f"[warn] Sub-collection {cid} could not be read (result {d.get('result')}).")
+                continue
+            for child in d["children"]:
+                wid = str(child.get("publishedfileid", ""))
+                if not wid.isdigit():
+                    continue
+                if child.get("filetype") == 2:  # k_EWorkshopFileTypeCollection
+                    if wid not in visited:
+                        visited.add(wid)
+                        queue.append(wid)
+                elif wid not in seen_items:
+                    seen_items.add(wid)
+                    items.append(wid)
+    if len(visited) > 1:
+        print(f"[i] Expanded {len(visited) - 1} nested collection(s).")
+    return items
+
+# browsesort=<x> on the browse page -> EPublishedFileQueryType
+QUERY_TYPES = {
+    "toprated": 0,                 # RankedByVote
+    "mostrecent": 1,               # RankedByPublicationDate
+    "trend": 3,                    # RankedByTrend
+    "totaluniquesubscribers": 9,   # RankedByTotalUniqueSubscriptions
+    "textsearch": 12,              # RankedByTextSearch
+    "lastupdated": 21,             # RankedByLastUpdatedDate
+}
+
+def query_files_params(url: str) -> dict | None:
+    """
+    Translate a /workshop/browse/ URL into QueryFiles parameters.
+    Returns None for listings QueryFiles can't reproduce (profiles, favorites, collections section,
+    all-time trend), so the caller falls back to HTML.
+    """
+    u = urlparse(url)
+    if not u.path.rstrip("/").endswith("/workshop/browse"):
+        return None
+    q = parse_qs(u.query)
+    appid = q.get("appid", [""])[0]
+    if not appid.isdigit() or q.get("section", [""])[0] == "collections":
+        return None
+    search = q.get("searchtext", [""])[0].strip()
+    sort = q.get("browsesort", ["textsearch" if search else "trend"])[0]
+    if sort not in QUERY_TYPES:
+        return None
+    params = {
+        "query_type": QUERY_TYPES[sort],
+        "appid": appid,
+        "creator_appid": appid,
+        "numperpage": 100,  # API maximum
+        "match_all_tags": "true",
+        "return_details": "true",  # otherwise titles/time_updated/file_size come back empty
+    }
+    if search:
+        params["search_text"] = search
+    if sort == "trend":
+        days = q.get("days", ["7"])[0]
+        if not days.isdigit() or int(days) <= 0:  # days=-1 is "all time", which QueryFiles has no ranking for
+            return None
+        params["days"] = days
+    tags = q.get("requiredtags[]", []) + [v[0] for k, v in sorted(q.items()) if re.fullmatch(r"requiredtags\[\d+\]", k)]
+    for i, t in enumerate(tags):
+        params[f"requiredtags[{i}]"] = t
+    excluded = q.get("excludedtags[]", [])
+    for i, t in enumerate(excluded):
+        params[f"excludedtags[{i}]"] = t
+    return params
+
+def query_files(url: str, api_key: str, max_items: int = 0) -> dict[str, dict] | None:
     """
-    if not ids:
-        return {}
-    url = "https://api.steampowered.com/ISteamRemoteStorage/GetPublishedFileDetails/v1/"
-    titles = {}
-    BATCH = 100  # API lets 100 per call
-    for i in range(0, len(ids), BATCH):
-        batch = ids[i:i + BATCH]
-        payload = {"itemcount": len(batch)}
-        for j, wid in enumerate(batch):
-            payload[f"publishedfileids[{j}]"] = str(wid)
+    Enumerate a browse/search listing with IPublishedFileService/QueryFiles using
+    cursor pagination, 100 items per call.
+    Returns { id: {"title", "time_updated", "file_size"} } in listing order, or None
+    if the URL can't be expressed as a query or any page failed.
+    """
+    params = query_files_params(url)
+    if params is None or not api_key:
+        return None
+    endpoint = "https://api.steampowered.com/IPublishedFileService/QueryFiles/v1/"
+    out = {}
+    cursor = "*"
+    page = 0
+    while True:
+        page += 1
         try:
-            r = requests.post(url, data=payload, timeout=30)
+            r = api_session().get(endpoint, params={**params, "key": api_key, "cursor": cursor}, timeout=30)
             r.raise_for_status()
-            js = r.json()
-            for it in js.get("response", {}).get("publishedfiledetails", []):
-                if it.get("result") == 1:
-                    titles[str(it["publishedfileid"])] = (it.get("title") or "").strip()
+            resp = r.json().get("response", {})
         except Exception as e:
-            print(f"[warn] title lookup failed for batch {i//BATCH+1}: {e}")
-    return titles
+            # a partial enumeration must not pass for the whole listing
+            print(f"[warn] QueryFiles page {page} failed after {len(out)} items: {e}")
+            return None
+        details = resp.get("publishedfiledetails") or []
+        for it in details:
+            wid = str(it.get("publishedfileid", ""))
+            if wid.isdigit() and it.get("result", 1) == 1:
+                out[wid] = {
+                    "title": (it.get("title") or "").strip(),
+                    "time_updated": int(it.get("time_updated", 0) or 0),
+                    "file_size": int(it.get("file_size", 0) or 0),
+                }
+        print(f"[+] QueryFiles page {page}: +{len(details)} (total {len(out)} of {resp.get('total', '?')})")
+        nxt = resp.get("next_cursor")
+        if not details or not nxt or nxt == cursor:
+            break
+        if max_items and len(out) >= max_items:
+            print(f"[info] Reached the configured limit of {max_items} items (max_pages × 30). Stopping.")
+            out = dict(list(out.items())[:max_items])
+            break
+        cursor = nxt
+    return out
+
+def fetch_titles_via_api(ids):
+    """
+    Titles from GetPublishedFileDetails, read through the shared metadata cache
+    (only missing or stale rows hit the API).
+    Returns: dict[str id] -> str title
+    """
+    rows = get_details(ids, ttl=CONFIG.get("meta_ttl", 0))
+    return {mid: row["title"] for mid, row in rows.items() if row["result"] == 1}
 
 # Main 
 def main():
     print("=== Steam Workshop Scraper (organized outputs) ===")
+    run_metrics.start("scraper", CONFIG.get("profile", ""), CONFIG.get("profile_memory", False))
 
-    url = input("Paste any Workshop LISTING URL: ").strip()
+    url = input("Paste any Workshop LISTING URL (or a collection link): ").strip()
 
-    if not (url.startswith("https://steamcommunity.com/") and "workshop" in url):
+    # Collections are usually shared as /sharedfiles/filedetails/?id=..., without "workshop" in them.
+    if not (url.startswith("https://steamcommunity.com/") and ("workshop" in url or collection_id_from_url(url))):
         print("❌ Invalid Steam Workshop URL.")
         return
  
@@ -272,18 +675,33 @@ def main():
     base       = CONFIG["base"]
     max_pages  = CONFIG["max_pages"]
     delay      = CONFIG["delay"]
-
-    # Detect AppID (and a readable game name) before setting paths
-    s_meta = requests.Session()
-    s_meta.headers.update(UA)
-    if use_cookies and cookie_path:
-        try:
-            load_cookies(s_meta, cookie_path)
-        except Exception:
-            pass
-
-    appid = detect_appid(url, s_meta)
-    game_name = detect_app_name(s_meta, url) or (f"AppID_{appid}" if appid else None)
+    concurrency = max(1, int(CONFIG.get("concurrency", 1) or 1))
+    if delay and delay > 0:
+        set_start_rate("steamcommunity.com", 1 / delay)
+
+    with run_metrics.phase("setup"):
+        # One session for the whole run: cookies are loaded and checked once, and
+        # page 1 is fetched once for appid, game name and the crawl.
+        cache = CONFIG.get("http_cache", True)
+        cookies_loaded = False
+        if use_cookies and cookie_path:
+            session = make_session(concurrency, "cookie" if cache else None)
+            try:
+                fmt = load_cookies(session, cookie_path)
+                print(f"✅ Loaded cookies ({fmt}) from {cookie_path}")
+                if is_cookie_active(session):
+                    print("✅ Cookies active — fetching WITH cookies.")
+                    cookies_loaded = True
+                else:
+                    print("⚠️ Cookies inactive — using NO cookies.")
+            except Exception as e:
+                print(f"⚠️ Failed to load cookies — using NO cookies: {e}")
+        if not cookies_loaded:
+            session = make_session(concurrency, "anon" if cache else None)
+
+        # Detect AppID (and a readable game name) before setting paths
+        appid = detect_appid(url, session)
+        game_name = detect_app_name(session, url) or (f"AppID_{appid}" if appid else None)
 
     # Root output dir: "<base> Steam Workshop Mods"
     # Root output dir: "<Game> - <appid>"  (no "Mod links")
@@ -297,32 +715,62 @@ def main():
     LISTS_SUBDIR = "lists"
     data_dir = os.path.join(root_dir, LISTS_SUBDIR)
     os.makedirs(data_dir, exist_ok=True)
+    run_metrics.current.folder = os.path.join(root_dir, "reports")
 
     print("\n--- Fetching Workshop Listing ---")
 
     all_ids = set()
-    cookies_loaded = False
-
-    if use_cookies and cookie_path:
-        s = requests.Session()
-        s.headers.update(UA)
-        try:
-            fmt = load_cookies(s, cookie_path)
-            print(f"✅ Loaded cookies ({fmt}) from {cookie_path}")
-            if is_cookie_active(s):
-                print("✅ Cookies active — fetching WITH cookies...")
-                all_ids = fetch_ids(s, url, max_pages, delay)
-                cookies_loaded = True
+    ids_path = path_join(data_dir, "ids.txt")
+    prev_ids = read_id_list(ids_path)
+    stopped_early = ""  # why the listing wasn't crawled to its end, if it wasn't
+
+    with run_metrics.phase("crawl") as ph:
+        # Collections resolve through the API in a handful of calls; HTML paging is the fallback.
+        collection_id = collection_id_from_url(url)
+        if collection_id:
+            print(f"[i] Collection {collection_id} — resolving via GetCollectionDetails...")
+            children = resolve_collection(collection_id)
+            if children:
+                all_ids = set(children)
+                print(f"✅ Collection resolved: {len(all_ids)} items.")
             else:
-                print("⚠️ Cookies inactive — using NO cookies.")
-        except Exception as e:
-            print(f"⚠️ Failed to load cookies — using NO cookies: {e}")
-
-    if not cookies_loaded:
-        s_plain = requests.Session()
-        s_plain.headers.update(UA)
-        print("➡️ Fetching WITHOUT cookies...")
-        all_ids = fetch_ids(s_plain, url, max_pages, delay)
+                print("⚠️ Collection API returned nothing — falling back to HTML scraping.")
+
+        # Browse/search listings: QueryFiles returns IDs and titles in one pass, 100 at a time.
+        listing_meta = {}
+        if not all_ids and CONFIG.get("use_query_files") and CONFIG.get("api_key"):
+            rows = query_files(url, CONFIG["api_key"], max_items=(max_pages * 30 if max_pages else 0))
+            if rows:
+                listing_meta = rows
+                all_ids = set(rows)
+                print(f"✅ QueryFiles returned {len(all_ids)} items.")
+                if max_pages and len(rows) >= max_pages * 30:
+                    stopped_early = "max_pages"
+            elif query_files_params(url) is not None:
+                print("⚠️ QueryFiles returned nothing — falling back to HTML scraping.")
+
+        if not all_ids:
+            print("➡️ Fetching WITH cookies..." if cookies_loaded else "➡️ Fetching WITHOUT cookies...")
+            incremental = bool(CONFIG.get("incremental") and prev_ids)
+            if incremental:
+                print(f"[i] Incremental: {len(prev_ids)} IDs known from the previous run.")
+            status = {}
+            all_ids = fetch_ids(session, url, max_pages, concurrency,
+                                known=prev_ids if incremental else None,
+                                known_pages=CONFIG.get("incremental_known_pages", 3),
+                                status=status,
+                                checkpoint=path_join(data_dir, "crawl_checkpoint.json"),
+                                cookie_mode="cookie" if cookies_loaded else "anon")
+            if status.get("stop") in ("known", "max_pages", "error"):
+                stopped_early = status["stop"]
+            if status.get("stop") == "known":
+                # Pages past the stop point are assumed unchanged since the last run.
+                all_ids = all_ids | prev_ids
+            elif status.get("stop") == "error" and all_ids and not CONFIG.get("allow_partial"):
+                print(f"❌ Crawl stopped early with {len(all_ids)} IDs — not touching the saved lists.\n"
+                      f"   Rerun to resume from the checkpoint, or set CONFIG['allow_partial'] = True to save it anyway.")
+                return
+        ph["items"] = len(all_ids)
 
     if not all_ids:
         print("❌ No items found.")
@@ -331,31 +779,80 @@ def main():
     sorted_all = sorted(all_ids)
 
     # Output file paths
-    ids_path        = path_join(data_dir, "ids.txt")
     ids_titles_path = path_join(data_dir, "ids_titles.txt")
     urls_path       = path_join(data_dir, "urls.txt")
+    added_path      = path_join(data_dir, "added_ids.txt")
+    removed_path    = path_join(data_dir, "removed_ids.txt")
 
     # Record original run date if this is the first time for this game/appid
     write_original_run_date_if_missing(root_dir)
 
-    # Move previous run’s files into 'old runs/<YYYY-MM-DD>'
-    archive_current_outputs(root_dir, [ids_path, ids_titles_path, urls_path])
+    # Run history: a delta per run in one compressed log (the first logged run also records
+    # the lists left by runs from before the log existed).
+    hist_path = history_path(data_dir)
+    if CONFIG.get("history", True) and prev_ids and not os.path.exists(hist_path):
+        append_run(hist_path, prev_ids, read_titles_file(ids_titles_path), source="previous ids.txt")
+
+    # Legacy: move previous run’s files into 'old runs/<YYYY-MM-DD>'
+    if CONFIG.get("keep_old_runs", False) or not CONFIG.get("history", True):
+        archive_current_outputs(root_dir, [ids_path, ids_titles_path, urls_path, added_path, removed_path])
 
     # Fetch titles and build lines AFTER archiving old files
-    titles = fetch_titles_via_api(sorted_all)
+    with run_metrics.phase("titles", items=len(sorted_all)):
+        if listing_meta:
+            store_details(listing_meta)
+            titles = {mid: row["title"] for mid, row in listing_meta.items()}
+        else:
+            titles = fetch_titles_via_api(sorted_all)
     id_title_lines = [f"{mid}\t{titles.get(str(mid), '')}" for mid in sorted_all]
 
     # Write current run files
-    write_lines(ids_path,  sorted_all)
-    write_lines(urls_path, [f"https://steamcommunity.com/sharedfiles/filedetails/?id={x}" for x in sorted_all])
-    write_lines(ids_titles_path, id_title_lines)
+    with run_metrics.phase("write", items=len(sorted_all)):
+        write_lines(ids_path,  sorted_all)
+        write_lines(urls_path, [f"https://steamcommunity.com/sharedfiles/filedetails/?id={x}" for x in sorted_all])
+        write_lines(ids_titles_path, id_title_lines)
+
+        if CONFIG.get("history", True):
+            rec = append_run(hist_path, sorted_all, titles, source=url)
+            print(f"[i] History: run {rec['run']} logged (+{len(rec['added'])} -{len(rec['removed'])}) in {hist_path}")
+    run_metrics.gauge("ids", len(sorted_all))
 
     print(f"\n✅ Saved ({len(sorted_all)}) to:\n"
         f"  • {ids_path}\n"
         f"  • {urls_path}\n"
         f"  • {ids_titles_path}")
 
+    # Delta against the previous ids.txt. Removals are only known when the whole listing was
+    # crawled: after an early stop the previous IDs stand in for the uncrawled tail.
+    if prev_ids:
+        added = sorted(all_ids - prev_ids)
+        write_lines(added_path, added)
+        run_metrics.gauge("ids_added", len(added))
+        print(f"  • {added_path} (+{len(added)})")
+        if stopped_early:
+            if os.path.exists(removed_path):
+                os.remove(removed_path)
+            print(f"  • removed_ids.txt not written: the crawl stopped early ({stopped_early}), "
+                  f"so removals past that point can't be seen.")
+        else:
+            removed = sorted(prev_ids - all_ids)
+            write_lines(removed_path, removed)
+            run_metrics.gauge("ids_removed", len(removed))
+            print(f"  • {removed_path} (-{len(removed)})")
+
+def finish_metrics():
+    """Print the run's phase summary and save its report (see CONFIG["metrics"])."""
+    m = run_metrics.current
+    if not m.phases or not CONFIG.get("metrics", True):
+        return
+    print("\n" + m.summary_line())
+    path = m.write(prom_dir=CONFIG.get("metrics_prom_dir") or None)
+    if path:
+        print(f"[metrics] Report saved to {path}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    try:
+        main()
+    finally:
+        finish_metrics()
\ No newline at end of file
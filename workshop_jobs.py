@@ -0,0 +1,365 @@
+"""
+Non-interactive job runner: crawl many Workshop listings and download them in one pass.
+
+    python workshop_jobs.py jobs.json
+
+Example jobs.json:
+
+    {
+      "username": "my_steam_login",
+      "scraper": {"concurrency": 6},
+      "downloader": {"max_retries": 2, "sync_targets": ["D:/servers/{appid}/mods"]},
+      "jobs": [
+        {"url": "https://steamcommunity.com/workshop/browse/?appid=294100&browsesort=trend"},
+        {"url": "https://steamcommunity.com/sharedfiles/filedetails/?id=1234567890", "appid": "294100"},
+        {"ids_file": "0 - output/Some Game - 4000/lists/ids.txt", "appid": "4000", "ids_out": ""}
+      ]
+    }
+
+"scraper"/"downloader" override the CONFIG of the two scripts. A job is a listing or
+collection `url` (appid detected unless given) or an existing `ids_file` (appid taken
+from its "<Game> - <appid>" folder unless given); `ids_out` saves the crawled IDs. The
+password comes from $STEAM_PASSWORD, a prompt, or SteamCMD's cached login. Listings are
+crawled without cookies.
+
+Crawls run CRAWLERS at a time and stream IDs page by page into a planner, which hands
+batches of new/outdated items to a single logged-in SteamCMD serving every appid, so
+crawling, planning and downloading overlap. Retryable failures get another round at the
+end. An app whose crawl stopped early isn't treated as fully listed: sync_targets keeps
+its unlisted mods instead of deleting them. A summary and a metrics report (see
+run_metrics.py; "profile"/"profile_memory" in "downloader" turn on profiling) are
+written to "0 - output/job_runs/".
+"""
+import os
+import re
+import json
+import time
+import queue
+import getpass
+import argparse
+import threading
+import importlib.util
+from datetime import datetime
+import run_metrics
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+RUNS_DIR = os.path.join(HERE, "0 - output", "job_runs")
+CRAWLERS = 3        # listings crawled at once
+BATCH = 200         # IDs per planned download batch
+FLUSH_AFTER = 5.0   # seconds without new IDs before a partial batch is planned anyway
+
+
+def load_script(name, filename):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(HERE, filename))
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def appid_from_path(path):
+    """The AppID of the nearest "<Game> - <appid>" folder above `path`, as the downloader's ask_appid reads it."""
+    folder = os.path.dirname(os.path.abspath(path))
+    while True:
+        m = re.search(r"\s-\s(\d+)$", os.path.basename(folder))
+        if m:
+            return m.group(1)
+        parent = os.path.dirname(folder)
+        if parent == folder:
+            return ""
+        folder = parent
+
+
+def crawl_job(sc, job, emit):
+    """
+    Resolve one job to (appid, ids, complete), calling emit(appid, ids) as IDs become known.
+    Same order of sources as the scraper: collection API, QueryFiles, HTML pages.
+    `complete` is False when the crawl stopped early (an error, max_pages, a capped QueryFiles
+    result), so `ids` may be missing listed items.
+    """
+    appid = str(job.get("appid") or "")
+    if job.get("ids_file"):
+        appid = appid or appid_from_path(job["ids_file"])
+        if not appid:
+            print(f"❌ {job['ids_file']}: no \"<Game> - <appid>\" folder above it — add \"appid\" to the job.")
+            return "", set(), False
+        with open(job["ids_file"], "r", encoding="utf-8", errors="ignore") as f:
+            ids = [line.strip() for line in f if line.strip().isdigit()]
+        emit(appid, ids)
+        return appid, set(ids), True
+
+    url = job["url"]
+    concurrency = max(1, int(sc.CONFIG.get("concurrency", 1) or 1))
+    session = sc.make_session(concurrency, "anon" if sc.CONFIG.get("http_cache", True) else None)
+    appid = appid or sc.detect_appid(url, session) or ""
+    if not appid:
+        print(f"❌ {url}: couldn't detect the AppID — add \"appid\" to the job.")
+        return "", set(), False
+
+    collection_id = sc.collection_id_from_url(url)
+    if collection_id:
+        children = sc.resolve_collection(collection_id)
+        if children:
+            emit(appid, children)
+            return appid, set(children), True
+    if sc.CONFIG.get("use_query_files") and sc.CONFIG.get("api_key"):
+        max_pages = sc.CONFIG.get("max_pages", 0)
+        rows = sc.query_files(url, sc.CONFIG["api_key"], max_items=(max_pages * 30 if max_pages else 0))
+        if rows:
+            sc.store_details(rows)
+            emit(appid, list(rows))
+            if max_pages and len(rows) >= max_pages * 30:
+                print(f"⚠️ {url}: stopped at max_pages ({max_pages}); sync won't delete mods for this app.")
+                return appid, set(rows), False
+            return appid, set(rows), True
+
+    status = {}
+    ids = sc.fetch_ids(session, url, sc.CONFIG.get("max_pages", 0), concurrency, status=status,
+                       on_ids=lambda new: emit(appid, new))
+    if status.get("stop") in ("error", "max_pages", "known"):
+        print(f"⚠️ {url}: crawl stopped early ({status['stop']}) with {len(ids)} IDs; those are still "
+              f"downloaded, but sync won't delete mods for this app.")
+        return appid, ids, False
+    return appid, ids, True
+
+
+def planner(dl, id_q, plan_q, crawls, unplanned):
+    """
+    Collect streamed IDs per appid and plan them in batches of BATCH (or after FLUSH_AFTER
+    seconds of quiet). Puts (appid, [ids to fetch]) on plan_q, then None when all crawls ended.
+    A batch that fails to plan is reported, skipped and added to unplanned[appid].
+    """
+    pending, seen, indexes = {}, {}, {}
+
+    def flush(appid):
+        batch = pending.pop(appid, [])
+        if not batch:
+            return
+        try:
+            with run_metrics.phase("plan", items=len(batch)):
+                if appid not in indexes:
+                    indexes[appid] = dl.disk_index(appid)
+                plan = dl.plan_downloads(appid, batch, index=indexes[appid])
+        except Exception as e:
+            print(f"❌ [plan] {appid}: planning {len(batch)} IDs failed ({e}) — skipping this batch.")
+            run_metrics.count("plan_failures")
+            unplanned.setdefault(appid, []).extend(batch)
+            return
+        print(f"[plan] {appid}: {len(batch)} IDs → {len(plan['pending'])} to fetch {plan['counts']}")
+        if plan["pending"]:
+            plan_q.put((appid, plan["pending"]))
+
+    try:
+        while crawls:
+            try:
+                item = id_q.get(timeout=FLUSH_AFTER)
+            except queue.Empty:
+                for appid in list(pending):
+                    flush(appid)
+                continue
+            if item is None:
+                crawls -= 1
+                continue
+            appid, ids = item
+            known = seen.setdefault(appid, set())
+            new = [mid for mid in map(str, ids) if mid not in known]
+            known.update(new)
+            pending.setdefault(appid, []).extend(new)
+            if len(pending[appid]) >= BATCH:
+                flush(appid)
+        for appid in list(pending):
+            flush(appid)
+    finally:
+        plan_q.put(None)  # download_batches waits for this, even if planning broke
+
+
+def download_batches(dl, plan_q, username, password, results):
+    """Feed planned batches to one SteamCMD session. Returns { appid: { id: reason } } still worth retrying."""
+    retry = {}
+    session = None
+    fatal = None
+    while True:
+        item = plan_q.get()
+        if item is None:
+            break
+        appid, ids = item
+        res = results.setdefault(appid, {"fetched": [], "failed": {}, "permanent": {}, "planned": []})
+        if dl.CONFIG.get("dry_run", False):
+            res["planned"] += ids
+            continue
+        if fatal:
+            res["failed"].update({mid: fatal for mid in ids})
+            continue
+        if session is None or not session.alive():
+            session = dl.start_session(username, password)
+            if not session:
+                fatal = "SteamCMD login failed"
+                res["failed"].update({mid: fatal for mid in ids})
+                continue
+        print(f"\n[jobs] {appid}: downloading {len(ids)} items...")
+        with run_metrics.phase("download", items=len(ids)):
+            tracker = session.download(appid, ids, dl.CONFIG.get("chunk_timeout", 0))
+            failed = dl.verify_downloads(appid, ids, tracker)
+        res["fetched"] += [mid for mid in ids if mid not in failed]
+        for mid, reason in failed.items():
+            kind = dl.classify_failure(reason)
+            if kind == "permanent":
+                res["permanent"][mid] = reason
+            else:
+                retry.setdefault(appid, {})[mid] = reason
+                if kind == "fatal":
+                    fatal = reason
+        if any(r == "no result from SteamCMD" for r in failed.values()):
+            session.close()
+            session = None
+    if fatal:
+        print(f"❌ {fatal} — remaining batches were skipped.")
+        retry = {}
+
+    rounds = int(dl.CONFIG.get("max_retries", 0) or 0)
+    backoff = float(dl.CONFIG.get("retry_backoff", 30) or 0)
+    for attempt in range(1, rounds + 1):
+        if not retry:
+            break
+        wait = backoff * 2 ** (attempt - 1)
+        print(f"\n[retry] Round {attempt}/{rounds}: {sum(map(len, retry.values()))} items in {wait:.0f}s...")
+        time.sleep(wait)
+        again = {}
+        for appid, failed in retry.items():
+            if session is None or not session.alive():
+                session = dl.start_session(username, password)
+                if not session:
+                    again = retry
+                    break
+            ids = list(failed)
+            with run_metrics.phase("download", items=len(ids)):
+                tracker = session.download(appid, ids, dl.CONFIG.get("chunk_timeout", 0))
+                still = dl.verify_downloads(appid, ids, tracker)
+            results[appid]["fetched"] += [mid for mid in ids if mid not in still]
+            for mid, reason in still.items():
+                if dl.classify_failure(reason) == "permanent":
+                    results[appid]["permanent"][mid] = reason
+                else:
+                    again.setdefault(appid, {})[mid] = reason
+        retry = again
+    if session:
+        session.close()
+    return retry
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Crawl Workshop listings and download them in one pipelined run.")
+    ap.add_argument("jobfile")
+    args = ap.parse_args()
+    with open(args.jobfile, "r", encoding="utf-8") as f:
+        spec = json.load(f)
+    jobs = spec.get("jobs") or []
+    if not jobs:
+        print("No jobs in the job file.")
+        return 1
+
+    sc = load_script("workshop_scraper", "steamworkshop id downloader.py")
+    dl = load_script("steamcmd_automation", "steamcmd automation.py")
+    sc.CONFIG.update(spec.get("scraper", {}))
+    dl.CONFIG.update(spec.get("downloader", {}))
+
+    username = spec.get("username") or ""
+    if not username and not dl.CONFIG.get("dry_run", False):
+        print("The job file needs a \"username\".")
+        return 1
+    password = os.environ.get("STEAM_PASSWORD")
+    if password is None:
+        password = getpass.getpass("Steam password (blank = SteamCMD's cached login): ") if os.isatty(0) else ""
+
+    metrics = run_metrics.start("jobs", dl.CONFIG.get("profile", ""), dl.CONFIG.get("profile_memory", False))
+    started = time.time()
+    id_q, plan_q = queue.Queue(), queue.Queue()
+    crawled = {}  # job index -> (appid, ids, complete)
+    slots = threading.Semaphore(CRAWLERS)
+
+    def run(n, job):
+        try:
+            with slots, run_metrics.phase("crawl") as ph:
+                crawled[n] = crawl_job(sc, job, lambda appid, ids: id_q.put((appid, list(ids))))
+                ph["items"] = len(crawled[n][1])
+        except Exception as e:
+            print(f"❌ Job {n + 1} failed: {e}")
+            crawled[n] = (str(job.get("appid") or ""), set(), False)
+        finally:
+            id_q.put(None)  # the planner counts these, whatever happened above
+
+    threads = [threading.Thread(target=run, args=(n, job), daemon=True) for n, job in enumerate(jobs)]
+    for t in threads:
+        t.start()
+    unplanned = {}  # appid -> ids whose batch failed to plan
+    plan_thread = threading.Thread(target=planner, args=(dl, id_q, plan_q, len(jobs), unplanned), daemon=True)
+    plan_thread.start()
+
+    results = {}
+    retry = download_batches(dl, plan_q, username, password, results)
+    for t in threads:
+        t.join()
+    plan_thread.join()
+
+    # Per-appid post-processing, with every job's IDs for that app as the "keep" list.
+    # An incomplete crawl's IDs are not the whole listing, so that app's targets keep extra mods.
+    listed, partial = {}, set()
+    for n, job in enumerate(jobs):
+        appid, ids, complete = crawled.get(n, ("", set(), False))
+        if appid:
+            listed.setdefault(appid, set()).update(ids)
+            if not complete:
+                partial.add(appid)
+        if job.get("ids_out") and ids:
+            os.makedirs(os.path.dirname(os.path.abspath(job["ids_out"])), exist_ok=True)
+            with open(job["ids_out"], "w", encoding="utf-8") as f:
+                f.write("\n".join(sorted(ids)))
+    for appid, res in results.items():
+        res["failed"].update(retry.get(appid, {}))
+        if dl.CONFIG.get("dry_run", False):
+            continue
+        if dl.CONFIG.get("dedupe", False):
+            with run_metrics.phase("dedupe"):
+                dl.dedupe_content(appid)
+        if dl.CONFIG.get("sync_targets"):
+            if appid in partial and dl.CONFIG.get("sync_delete", True):
+                print(f"[sync] {appid}: a crawl for this app was incomplete — not deleting mods from the targets.")
+            with run_metrics.phase("sync"):
+                dl.sync_targets(appid, res["fetched"], sorted(listed.get(appid, ())),
+                                delete=dl.CONFIG.get("sync_delete", True) and appid not in partial)
+
+    summary = {
+        "started": datetime.fromtimestamp(started).isoformat(timespec="seconds"),
+        "seconds": round(time.time() - started, 1),
+        "jobs": [{"job": jobs[n], "appid": crawled.get(n, ("",))[0], "ids": len(crawled.get(n, ("", ()))[1]),
+                  "complete": crawled.get(n, ("", (), False))[2]}
+                 for n in range(len(jobs))],
+        "apps": {appid: {"fetched": len(res["fetched"]), "failed": res["failed"], "permanent": res["permanent"],
+                         "complete": appid not in partial}
+                 for appid, res in results.items()},
+    }
+    if unplanned:
+        summary["unplanned"] = unplanned
+    if dl.CONFIG.get("dry_run", False):
+        summary["dry_run"] = {appid: res["planned"] for appid, res in results.items()}
+    os.makedirs(RUNS_DIR, exist_ok=True)
+    if dl.CONFIG.get("metrics", True):
+        summary["metrics"] = os.path.basename(metrics.write(RUNS_DIR, dl.CONFIG.get("metrics_prom_dir") or None))
+    out = os.path.join(RUNS_DIR, datetime.fromtimestamp(started).strftime("%Y-%m-%d %H-%M-%S") + ".json")
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=1)
+
+    print("\n=== Job run finished ===")
+    for appid, res in summary["apps"].items():
+        if "dry_run" in summary:
+            print(f"  {appid}: {len(summary['dry_run'][appid])} would be fetched (dry run)")
+        else:
+            print(f"  {appid}: {res['fetched']} fetched, {len(res['failed'])} failed, {len(res['permanent'])} permanent")
+    for appid, ids in unplanned.items():
+        print(f"  {appid}: {len(ids)} IDs not planned (see the errors above)")
+    print(f"  Summary: {out}")
+    print(metrics.summary_line())
+    return 0 if not unplanned and not any(res["failed"] for res in summary["apps"].values()) else 2
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
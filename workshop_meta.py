@@ -0,0 +1,184 @@
+import os
+import time
+import sqlite3
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from steam_http import mount_limited
+import run_metrics
+
+# Shared by "steamworkshop id downloader.py" and "steamcmd automation.py":
+# a local cache of GetPublishedFileDetails results keyed by publishedfileid.
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(SCRIPT_DIR, "0 - output", "workshop_meta.sqlite3")
+
+DETAILS_URL = "https://api.steampowered.com/ISteamRemoteStorage/GetPublishedFileDetails/v1/"
+BATCH = 100            # API lets 100 per call
+DEFAULT_TTL = 6 * 3600  # seconds a cached row is trusted
+WORKERS = 4            # detail batches in flight at once
+RETRIES = 3            # extra rounds for batches that failed
+
+FIELDS = ("title", "time_updated", "file_size", "result", "fetched_at")
+
+
+class MetaStore:
+    """SQLite-backed { publishedfileid: row } cache. Rows are dicts with FIELDS."""
+
+    def __init__(self, path: str = DB_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS details ("
+            " id TEXT PRIMARY KEY,"
+            " title TEXT NOT NULL DEFAULT '',"
+            " time_updated INTEGER NOT NULL DEFAULT 0,"
+            " file_size INTEGER NOT NULL DEFAULT 0,"
+            " result INTEGER NOT NULL DEFAULT 0,"
+            " fetched_at REAL NOT NULL DEFAULT 0)"
+        )
+        self.db.commit()
+
+    def get_many(self, ids) -> dict[str, dict]:
+        out = {}
+        ids = [str(i) for i in ids]
+        for i in range(0, len(ids), 500):  # stay under SQLite's host-parameter limit
+            chunk = ids[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            for row in self.db.execute(f"SELECT id, {', '.join(FIELDS)} FROM details WHERE id IN ({marks})", chunk):
+                out[row[0]] = dict(zip(FIELDS, row[1:]))
+        return out
+
+    def put_many(self, rows: dict[str, dict]):
+        now = time.time()
+        self.db.executemany(
+            "INSERT OR REPLACE INTO details (id, title, time_updated, file_size, result, fetched_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(str(mid), r.get("title") or "", int(r.get("time_updated") or 0), int(r.get("file_size") or 0),
+              int(r.get("result") or 0), float(r.get("fetched_at") or now)) for mid, r in rows.items()],
+        )
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+
+def _row_from_api(item: dict) -> dict:
+    return {
+        "title": (item.get("title") or "").strip(),
+        "time_updated": int(item.get("time_updated", 0) or 0),
+        "file_size": int(item.get("file_size", 0) or 0),
+        "result": int(item.get("result", 0) or 0),
+        "fetched_at": time.time(),
+    }
+
+
+_session = None
+_session_lock = threading.Lock()
+
+def api_session():
+    """Keep-alive, rate-limited session shared by every detail call, pooled for WORKERS threads."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = mount_limited(requests.Session(), WORKERS)
+        return _session
+
+
+def fetch_details_batch(ids: list[str]) -> dict[str, dict]:
+    """One GetPublishedFileDetails call for up to BATCH ids. Raises on HTTP/JSON errors."""
+    payload = {"itemcount": len(ids)}
+    for j, mid in enumerate(ids):
+        payload[f"publishedfileids[{j}]"] = str(mid)
+    r = api_session().post(DETAILS_URL, data=payload, timeout=30)
+    r.raise_for_status()
+    out = {}
+    for item in r.json().get("response", {}).get("publishedfiledetails", []):
+        mid = str(item.get("publishedfileid", ""))
+        if mid:
+            out[mid] = _row_from_api(item)
+    return out
+
+
+def fetch_details(ids: list[str], workers: int = WORKERS, retries: int = RETRIES) -> tuple[dict[str, dict], list[str]]:
+    """
+    Fetch details for `ids` in BATCH-sized chunks, `workers` chunks at a time.
+    Only chunks that failed are retried (up to `retries` more rounds, with backoff).
+    Returns (rows, failed_ids) — failed ids are the ones no attempt could fetch.
+    """
+    chunks = [ids[i:i + BATCH] for i in range(0, len(ids), BATCH)]
+    rows = {}
+    for attempt in range(retries + 1):
+        if not chunks:
+            break
+        if attempt:
+            wait = min(30, 2 ** attempt)
+            print(f"[meta] retrying {len(chunks)} failed batch(es) in {wait}s (attempt {attempt + 1}/{retries + 1})")
+            time.sleep(wait)
+        failed = []
+
+        def run(chunk):
+            try:
+                return chunk, fetch_details_batch(chunk), None
+            except Exception as e:
+                return chunk, None, e
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+            for chunk, got, err in ex.map(run, chunks):
+                if err is not None:
+                    print(f"[warn] details batch of {len(chunk)} ids failed: {err}")
+                    failed.append(chunk)
+                else:
+                    rows.update(got)
+        chunks = failed
+    return rows, [mid for chunk in chunks for mid in chunk]
+
+
+def store_details(rows: dict[str, dict], path: str = DB_PATH):
+    """
+    Save rows obtained elsewhere (e.g. QueryFiles) so later lookups can skip the API.
+    Rows without a time_updated are left out: cached as 0 they would make an installed
+    item look up to date.
+    """
+    rows = {mid: r for mid, r in (rows or {}).items() if r.get("time_updated")}
+    if not rows:
+        return
+    store = MetaStore(path)
+    try:
+        store.put_many({mid: {"result": 1, **r} for mid, r in rows.items()})
+    finally:
+        store.close()
+
+
+def get_details(ids, ttl: float = DEFAULT_TTL, path: str = DB_PATH) -> dict[str, dict]:
+    """
+    Read-through lookup: cached rows younger than `ttl` seconds are used as-is,
+    missing or stale ids are fetched with fetch_details() and written back.
+    If a batch keeps failing, stale rows for it are returned (with a warning) rather than nothing;
+    ids with no row at all are left out, so callers can tell "unknown" from "never updated".
+    Returns { id: row } for every id we have any data for.
+    """
+    ids = list(dict.fromkeys(str(i) for i in ids))
+    if not ids:
+        return {}
+    store = MetaStore(path)
+    try:
+        cached = store.get_many(ids)
+        cutoff = time.time() - ttl
+        todo = [mid for mid in ids if mid not in cached or cached[mid]["fetched_at"] < cutoff]
+        if len(todo) < len(ids):
+            print(f"[meta] {len(ids) - len(todo)}/{len(ids)} from cache, fetching {len(todo)}.")
+        run_metrics.count("meta_cache_hits", len(ids) - len(todo))
+        if todo:
+            fresh, failed = fetch_details(todo)
+            run_metrics.count("meta_fetched", len(fresh))
+            run_metrics.count("meta_failed", len(failed))
+            store.put_many(fresh)
+            cached.update(fresh)
+            if failed:
+                stale = sum(1 for mid in failed if mid in cached)
+                print(f"[warn] details unavailable for {len(failed)} ids ({stale} stale rows kept).")
+        return {mid: cached[mid] for mid in ids if mid in cached}
+    finally:
+        store.close()